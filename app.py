@@ -1,17 +1,104 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, send_file
+from flask import Flask, Request, abort, g, has_request_context, render_template, request, redirect, url_for, flash, jsonify, Response, send_file, send_from_directory, get_template_attribute, stream_with_context, session
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limits.storage import Storage as RateLimitStorage
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import safe_join
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session as SASession, make_transient_to_detached
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import base64
+import bisect
+import click
+import csv
+import fcntl
+import functools
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import mimetypes
+import multiprocessing
+import re
+import queue
+import random
+import sqlite3
+import threading
+import time
+import traceback
 import uuid
 import io
 import os
+import unicodedata
+import urllib.parse
+import zipfile
+import zlib
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is used
+    brotli = None
 # Paradigm ❤️ Souvenir Club
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
 # ok ish
+# Ticket QR codes carry an HMAC of their token so scanners can reject forgeries without a DB hit.
+# Set TICKET_REQUIRE_SIGNATURE=1 once every printed ticket has been reissued with a signature.
+app.config['TICKET_SIGNING_KEY'] = os.environ.get('TICKET_SIGNING_KEY') or app.config['SECRET_KEY']
+app.config['TICKET_REQUIRE_SIGNATURE'] = os.environ.get('TICKET_REQUIRE_SIGNATURE') == '1'
+# Authenticated requests are served from a per-process user cache; entries live this many seconds,
+# which is also how long another worker may take to apply a role change or a logout (see load_user).
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', '60'))
+# ...and the nav bar's unread count and preview from a per-user cache for this many seconds.
+app.config['NAV_NOTIFICATIONS_TTL'] = int(os.environ.get('NAV_NOTIFICATIONS_TTL', '30'))
+# Notification fan-out is delivered from the outbox by a background thread in each web process
+# ('thread'), or only by a separately run `flask outbox-worker` ('external').
+app.config['OUTBOX_WORKER'] = os.environ.get('OUTBOX_WORKER', 'thread')
+# Live updates (/stream): open connections allowed per worker process and seconds between heartbeats.
+app.config['SSE_MAX_CONNECTIONS'] = int(os.environ.get('SSE_MAX_CONNECTIONS', '24'))
+app.config['SSE_HEARTBEAT'] = int(os.environ.get('SSE_HEARTBEAT', '15'))
+# Rendered ticket QR codes: on-disk cache location and size, and whether to render them right after registering.
+app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR', os.path.join('cache', 'qr'))
+app.config['QR_CACHE_MAX_FILES'] = int(os.environ.get('QR_CACHE_MAX_FILES', '50000'))
+app.config['QR_PRERENDER'] = os.environ.get('QR_PRERENDER') == '1'
+# Homepage sections are cached per process. Writes replace HOMEPAGE_SIGNAL_FILE, which every worker on the
+# host checks, so changes show at once there; the TTL bounds their age on other hosts.
+app.config['HOMEPAGE_CACHE_TTL'] = int(os.environ.get('HOMEPAGE_CACHE_TTL', '30'))
+app.config['HOMEPAGE_SIGNAL_FILE'] = os.environ.get('HOMEPAGE_SIGNAL_FILE', os.path.join('cache', 'homepage.version'))
+# Rate-limit counters live in a small SQLite file shared by every worker on the host (see
+# SQLiteRateLimitStorage), so limits hold across gunicorn workers. memory:// keeps them per process.
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get(
+    'RATELIMIT_STORAGE_URI', 'sqlite-ratelimit:///' + os.path.join('cache', 'ratelimits.db'))
+# HTML, JSON and other text responses of at least COMPRESS_MIN_SIZE bytes are sent brotli- or
+# gzip-encoded to clients that accept it (see compress_response); COMPRESS_MIN_SIZE=0 turns it off.
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))
+# Request metrics (/metrics): each worker writes its counters to METRICS_DIR so a scrape sees them all.
+# Scrapers authenticate with `Authorization: Bearer $METRICS_TOKEN`; admins can open the page directly.
+# Statements slower than SLOW_QUERY_MS are logged with the route that ran them.
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join('cache', 'metrics'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', '250'))
+# Event attachments are stored once per distinct content under UPLOAD_DIR, at most MAX_UPLOAD_MB each.
+# Larger request bodies are refused (413) before they are read; the form around the file needs a little room.
+# Without a Content-Length (chunked uploads) the file is cut off at the first chunk past MAX_UPLOAD_MB.
+app.config['UPLOAD_DIR'] = os.environ.get('UPLOAD_DIR', 'uploads')
+app.config['MAX_UPLOAD_MB'] = int(os.environ.get('MAX_UPLOAD_MB', '25'))
+app.config['MAX_CONTENT_LENGTH'] = (app.config['MAX_UPLOAD_MB'] + 1) * 1024 * 1024
+# Attachment downloads can be handed to the front server: USE_X_SENDFILE=1 for Apache/lighttpd, or
+# UPLOAD_ACCEL_REDIRECT=/_uploads/ for an nginx `internal` location aliased to UPLOAD_DIR.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+app.config['UPLOAD_ACCEL_REDIRECT'] = os.environ.get('UPLOAD_ACCEL_REDIRECT')
+# CPU-bound work (password hashing on import, ticket sheets, thumbnails) runs in one pool of this many
+# processes per worker; see process_pool().
+app.config['PROCESS_POOL_WORKERS'] = int(os.environ.get('PROCESS_POOL_WORKERS', str(os.cpu_count() or 1)))
 
 uri = os.environ.get('DATABASE_URL')
 if not uri:
@@ -19,16 +106,150 @@ if not uri:
 
 app.config['SQLALCHEMY_DATABASE_URI'] = uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+# Optional read replica: GET/HEAD requests read from it unless the visitor wrote something in the
+# last REPLICA_PIN_SECONDS; writes always go to DATABASE_URL. See RoutingSession.
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+app.config['REPLICA_PIN_SECONDS'] = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+def _engine_options(url, prefix):
+    """Pool settings for one engine from <prefix>_POOL_SIZE / <prefix>_MAX_OVERFLOW; connections are pinged before use."""
+    options = {'pool_pre_ping': True}
+    if url and not (url.startswith('sqlite') and ':memory:' in url or url in ('sqlite://', 'sqlite:///')):
+        options['pool_size'] = int(os.environ.get(f'{prefix}_POOL_SIZE', '5'))
+        options['max_overflow'] = int(os.environ.get(f'{prefix}_MAX_OVERFLOW', '10'))
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(uri, 'DB')
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': {
+        'url': app.config['DATABASE_REPLICA_URL'],
+        **_engine_options(app.config['DATABASE_REPLICA_URL'], 'DB_REPLICA'),
+    }}
+
+
+READ_STATEMENT = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+def _is_read(clause):
+    if isinstance(clause, (db.Select, db.CompoundSelect)):
+        return True
+    return isinstance(clause, db.TextClause) and READ_STATEMENT.match(clause.text) is not None
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Session that sends SELECTs to the replica engine while `info['use_replica']` is set.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary, and the
+    first one switches the session to the primary for the rest of the request so
+    it reads its own writes. `info['wrote']` records that it happened, so the
+    visitor's next few requests can be pinned to the primary as well.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and 'replica' in self._db.engines:
+            if self._flushing or not _is_read(clause):
+                self.info['use_replica'] = False
+                self.info['wrote'] = True
+            elif self.info.get('use_replica'):
+                return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+@sa_event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a registration holds the write lock, and the busy
+    # timeout makes concurrent writers queue instead of failing with "database is locked".
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=15000')
+        cursor.close()
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+class SQLiteRateLimitStorage(RateLimitStorage):
+    """Fixed-window rate-limit counters in a local SQLite file shared by all worker processes.
+
+    `sqlite-ratelimit:///relative/path.db` or `sqlite-ratelimit:////absolute/path.db`.
+    A hit is one UPSERT that starts a new window once the old one has expired and
+    returns the new count, so it stays atomic across processes. WAL with
+    synchronous=NORMAL keeps that to tens of microseconds without an fsync per hit.
+    Expired windows are deleted every PRUNE_EVERY hits, so the file only holds keys
+    that are active in their current window.
+    """
+
+    STORAGE_SCHEME = ['sqlite-ratelimit']
+    PRUNE_EVERY = 1000
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        path = uri.split('://', 1)[1][1:]
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._hits = itertools.count()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, count INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL) WITHOUT ROWID'
+        )
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # One autocommit connection per thread, reopened after a fork (gunicorn workers).
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        connection = self._connection()
+        count, = connection.execute(
+            'INSERT INTO rate_limit (key, count, expires_at) VALUES (?1, ?2, ?3 + ?4) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'count = CASE WHEN expires_at <= ?3 THEN ?2 ELSE count + ?2 END, '
+            'expires_at = CASE WHEN expires_at <= ?3 OR ?5 THEN ?3 + ?4 ELSE expires_at END '
+            'RETURNING count', (key, amount, now, expiry, bool(elastic_expiry))
+        ).fetchone()
+        if next(self._hits) % self.PRUNE_EVERY == 0:
+            connection.execute('DELETE FROM rate_limit WHERE expires_at <= ?', (now,))
+        return count
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT count FROM rate_limit WHERE key = ? AND expires_at > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute('SELECT expires_at FROM rate_limit WHERE key = ?', (key,)).fetchone()
+        return row[0] if row and row[0] > time.time() else time.time()
+
+    def check(self):
+        return self._connection().execute('SELECT 1').fetchone() == (1,)
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limit').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limit WHERE key = ?', (key,))
+
 limiter = Limiter(get_remote_address, app=app, default_limits=["200 per day", "50 per hour"]) 
 
+EVENTS_PER_PAGE = 24
+ROWS_PER_PAGE = 50
+# The events page counts matches only up to here ("1000+"), so a broad filter never scans the whole table.
+EVENTS_COUNT_CAP = 1000
+
 
 class User(UserMixin, db.Model):
+    __table_args__ = (db.Index('ix_user_role', 'role'),)
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(120), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -36,11 +257,28 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), default='participant')  # admin, coordinator, participant
     school = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by bump_user_version() whenever role or password change; part of the session id, so
+    # sessions from before the change are logged out (see load_user).
+    version = db.Column(db.Integer, default=0, nullable=False)
+    # Kept in step by notify()/notify_many() and the mark-read routes; not part of the cached user.
+    unread_notifications = db.Column(db.Integer, default=0, nullable=False)
+    # Secret for /calendar/<token>.ics so calendar apps can subscribe without a session; not part of the
+    # cached user, so a new link shows up in every worker at once.
+    calendar_token = db.Column(db.String(64), unique=True)
     
 
     event_registrations = db.relationship('EventRegistration', backref='user', lazy='dynamic', cascade='all, delete-orphan')
 
+    def get_id(self):
+        return f'{self.id}:{self.version or 0}'
+
 class Event(db.Model):
+    __table_args__ = (
+        db.Index('ix_event_status_date', 'status', 'event_date'),
+        db.Index('ix_event_date', 'event_date'),
+        db.Index('ix_event_category_date', 'category', 'event_date'),
+        db.Index('ix_event_created_by', 'created_by'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -51,17 +289,30 @@ class Event(db.Model):
     status = db.Column(db.String(20), default='upcoming')  # upcoming, ongoing, completed, cancelled
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last change to anything a calendar feed shows; maintained by _touch_events() on flush.
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     category = db.Column(db.String(50), nullable=False)  # sports, academic, cultural, etc.
     require_approval = db.Column(db.Boolean, default=False)
     team_allowed = db.Column(db.Boolean, default=False)
     team_min = db.Column(db.Integer, default=1)
     team_max = db.Column(db.Integer, default=1)
+
+    # Denormalized counters, kept in step with the rows they count by adjust_event_counters()
+    # inside the same transaction. `flask recount-registrations` rebuilds them from scratch.
+    registration_count = db.Column(db.Integer, default=0, nullable=False, index=True)  # non-cancelled registrations
+    confirmed_count = db.Column(db.Integer, default=0, nullable=False)
+    waitlist_count = db.Column(db.Integer, default=0, nullable=False)
+    checkin_count = db.Column(db.Integer, default=0, nullable=False)
     
 
     creator = db.relationship('User', backref='created_events', foreign_keys=[created_by])
     registrations = db.relationship('EventRegistration', backref='event', lazy='dynamic', cascade='all, delete-orphan')
 
 class EventRegistration(db.Model):
+    __table_args__ = (
+        db.Index('uq_registration_event_user', 'event_id', 'user_id', unique=True),
+        db.Index('ix_registration_user_status', 'user_id', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -71,6 +322,7 @@ class EventRegistration(db.Model):
     team_name = db.Column(db.String(120))
 
 class Schedule(db.Model):
+    __table_args__ = (db.Index('ix_schedule_event_start', 'event_id', 'start_time'),)
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     activity = db.Column(db.String(200), nullable=False)
@@ -81,6 +333,7 @@ class Schedule(db.Model):
 
 
 class Comment(db.Model):
+    __table_args__ = (db.Index('ix_comment_event_created', 'event_id', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -91,6 +344,7 @@ class Comment(db.Model):
     event = db.relationship('Event')
 
 class Announcement(db.Model):
+    __table_args__ = (db.Index('ix_announcement_starts_at', 'starts_at'),)
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     body = db.Column(db.Text, nullable=False)
@@ -99,6 +353,10 @@ class Announcement(db.Model):
     is_pinned = db.Column(db.Boolean, default=False)
 
 class Waitlist(db.Model):
+    __table_args__ = (
+        db.Index('uq_waitlist_event_user', 'event_id', 'user_id', unique=True),
+        db.Index('ix_waitlist_event_position', 'event_id', 'position'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -106,18 +364,33 @@ class Waitlist(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class CheckIn(db.Model):
+    __table_args__ = (db.Index('uq_checkin_event_user', 'event_id', 'user_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     checked_in_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Ticket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    registration_id = db.Column(db.Integer, db.ForeignKey('event_registration.id'), unique=True, nullable=False)
+    token = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    registration = db.relationship('EventRegistration', backref=db.backref('ticket', uselist=False, cascade='all, delete-orphan'))
+
+    @property
+    def code(self):
+        return ticket_code(self.token)
+
 class UserMeta(db.Model):
+    __table_args__ = (db.Index('uq_user_meta_user_key', 'user_id', 'key', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     key = db.Column(db.String(100), nullable=False)
     value = db.Column(db.String(255))
 
 class PasswordResetToken(db.Model):
+    __table_args__ = (db.Index('ix_password_reset_token_user', 'user_id'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     token = db.Column(db.String(64), unique=True, nullable=False)
@@ -125,6 +398,7 @@ class PasswordResetToken(db.Model):
     used_at = db.Column(db.DateTime)
 
 class EmailVerificationToken(db.Model):
+    __table_args__ = (db.Index('ix_email_verification_user_verified', 'user_id', 'verified_at'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     token = db.Column(db.String(64), unique=True, nullable=False)
@@ -132,12 +406,17 @@ class EmailVerificationToken(db.Model):
     verified_at = db.Column(db.DateTime)
 
 class EventMeta(db.Model):
+    __table_args__ = (db.Index('uq_event_meta_event_key', 'event_id', 'key', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     key = db.Column(db.String(100), nullable=False)
     value = db.Column(db.String(255))
 
 class EventCoordinator(db.Model):
+    __table_args__ = (
+        db.Index('uq_event_coordinator_event_user', 'event_id', 'user_id', unique=True),
+        db.Index('ix_event_coordinator_user', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -149,12 +428,19 @@ class Venue(db.Model):
     location = db.Column(db.String(200))
 
 class EventAttachment(db.Model):
+    __table_args__ = (db.Index('ix_event_attachment_event', 'event_id'),)
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    # The name it was uploaded under. Rows without a sha256 predate deduplication and
+    # name their own file directly under UPLOAD_DIR instead.
     filename = db.Column(db.String(255), nullable=False)
+    sha256 = db.Column(db.String(64))
+    size = db.Column(db.Integer)
+    content_type = db.Column(db.String(100))  # guessed from the file name on upload, never taken from the client
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Notification(db.Model):
+    __table_args__ = (db.Index('ix_notification_user_read_created', 'user_id', 'read_at', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -171,9 +457,1013 @@ class AuditLog(db.Model):
     snapshot = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class OutboxMessage(db.Model):
+    # One row per fan-out (e.g. "notify this event's staff"), written in the request's transaction
+    # and expanded into Notification/AuditLog rows later by process_outbox().
+    __table_args__ = (db.Index('ix_outbox_pending', 'processed_at', 'available_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+
+class ChangeLog(db.Model):
+    # Append-only feed behind /stream. Rows are written in the same transaction as the change
+    # they describe, and every worker process tails the table, so it doubles as cross-process
+    # pub/sub. The id is the SSE event id used for Last-Event-ID replay.
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(64), nullable=False, index=True)  # user:<id> or event:<id>
+    kind = db.Column(db.String(32), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Versioned schema/data migrations for databases that predate a model change.
+# db.create_all() only creates missing tables, so new columns and indexes on existing tables
+# and data backfills go here. Each migration must be safe to run on a fresh database.
+# They are applied by `flask init-db`, never on import.
+MIGRATIONS = []
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+def _add_column_if_missing(table, column, ddl):
+    columns = {c['name'] for c in db.inspect(db.engine).get_columns(table)}
+    if column not in columns:
+        db.session.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+def _create_index_if_missing(table, name):
+    """Create an index declared in a model's __table_args__ on a table that predates it."""
+    index = next(i for i in db.metadata.tables[table].indexes if i.name == name)
+    index.create(bind=db.session.connection(), checkfirst=True)
+
+def _duplicates(model, *columns):
+    """Ids of every row but the earliest per `columns`: the rows a unique index over them would reject."""
+    keep = db.select(db.func.min(model.id)).group_by(*columns)
+    return db.select(model.id).where(model.id.not_in(keep))
+
+def _drop_duplicates(model, *columns):
+    """Delete the _duplicates() of `columns` so a unique index over them can be built. Returns rows deleted."""
+    return model.query.filter(model.id.in_(_duplicates(model, *columns))).delete(synchronize_session=False)
+
+def run_migrations():
+    # Each migration runs in the transaction committed here, together with its SchemaMigration
+    # row, so migrations and the helpers they call must not commit themselves.
+    applied = {m.version for m in SchemaMigration.query.all()}
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        fn()
+        db.session.add(SchemaMigration(version=version, name=name))
+        db.session.commit()
+        print(f"Applied migration {version}: {name}")
+
+@migration(1, 'event registration counters')
+def _migrate_event_counters():
+    for column in ('registration_count', 'confirmed_count', 'waitlist_count', 'checkin_count'):
+        _add_column_if_missing('event', column, 'INTEGER NOT NULL DEFAULT 0')
+    db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_event_registration_count ON event (registration_count)'))
+    recompute_event_counters()
+
+
+@migration(2, 'ticket table backfill and unique check-ins')
+def _migrate_tickets():
+    # Drop duplicate check-ins so the unique (event_id, user_id) index can be created.
+    removed = _drop_duplicates(CheckIn, CheckIn.event_id, CheckIn.user_id)
+    db.session.execute(db.text('CREATE UNIQUE INDEX IF NOT EXISTS uq_checkin_event_user ON check_in (event_id, user_id)'))
+
+    rows = db.session.query(EventRegistration.id, EventRegistration.notes).outerjoin(
+        Ticket, Ticket.registration_id == EventRegistration.id
+    ).filter(Ticket.id.is_(None), EventRegistration.notes.like('%qr:%'))
+    batch = []
+    for reg_id, notes in rows.yield_per(1000):
+        match = LEGACY_QR_NOTE.search(notes)
+        if match:
+            batch.append({'registration_id': reg_id, 'token': match.group(1), 'created_at': datetime.utcnow()})
+        if len(batch) >= 1000:
+            db.session.execute(db.insert(Ticket), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Ticket), batch)
+    if removed:
+        recompute_event_counters()
+
+
+@migration(3, 'unique registrations and waitlist entries per user')
+def _migrate_unique_registrations():
+    # Races in the old registration path could leave duplicates; keep each user's earliest row.
+    Ticket.query.filter(Ticket.registration_id.in_(
+        _duplicates(EventRegistration, EventRegistration.event_id, EventRegistration.user_id)
+    )).delete(synchronize_session=False)
+    removed = _drop_duplicates(EventRegistration, EventRegistration.event_id, EventRegistration.user_id)
+    removed += _drop_duplicates(Waitlist, Waitlist.event_id, Waitlist.user_id)
+    db.session.execute(db.text('CREATE UNIQUE INDEX IF NOT EXISTS uq_registration_event_user ON event_registration (event_id, user_id)'))
+    db.session.execute(db.text('CREATE UNIQUE INDEX IF NOT EXISTS uq_waitlist_event_user ON waitlist (event_id, user_id)'))
+    if removed:
+        recompute_event_counters()
+
+
+@migration(4, 'full-text search index for events')
+def _migrate_event_search():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # External-content FTS5 table kept in sync by triggers, so every write path
+        # (create, edits, bulk imports) is indexed. Counter updates don't touch it.
+        try:
+            db.session.execute(db.text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5("
+                "title, description, location, category, content='event', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            ))
+        except OperationalError as e:
+            print(f"FTS5 unavailable, event search falls back to ILIKE: {e}")
+            return
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS event_fts_ai AFTER INSERT ON event BEGIN "
+            "INSERT INTO event_fts(rowid, title, description, location, category) "
+            "VALUES (new.id, new.title, new.description, new.location, new.category); END"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS event_fts_ad AFTER DELETE ON event BEGIN "
+            "INSERT INTO event_fts(event_fts, rowid, title, description, location, category) "
+            "VALUES ('delete', old.id, old.title, old.description, old.location, old.category); END"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS event_fts_au AFTER UPDATE OF title, description, location, category ON event BEGIN "
+            "INSERT INTO event_fts(event_fts, rowid, title, description, location, category) "
+            "VALUES ('delete', old.id, old.title, old.description, old.location, old.category); "
+            "INSERT INTO event_fts(rowid, title, description, location, category) "
+            "VALUES (new.id, new.title, new.description, new.location, new.category); END"
+        ))
+        db.session.execute(db.text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        # A generated column is recomputed by PostgreSQL on every insert/update of the row.
+        db.session.execute(db.text(
+            "ALTER TABLE event ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(category, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(location, '')), 'C') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'D')) STORED"
+        ))
+        db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_event_search_vector ON event USING GIN (search_vector)'))
+
+@migration(5, 'user version stamp')
+def _migrate_user_version():
+    _add_column_if_missing('user', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+@migration(6, 'unread notification counter')
+def _migrate_unread_notifications():
+    _add_column_if_missing('user', 'unread_notifications', 'INTEGER NOT NULL DEFAULT 0')
+    db.session.execute(db.text(
+        'CREATE INDEX IF NOT EXISTS ix_notification_user_read_created ON notification (user_id, read_at, created_at)'
+    ))
+    recompute_unread_notifications()
+
+@migration(7, 'event updated_at and calendar feed tokens')
+def _migrate_calendar_feeds():
+    _add_column_if_missing('event', 'updated_at', 'TIMESTAMP')
+    db.session.execute(db.text('UPDATE event SET updated_at = created_at WHERE updated_at IS NULL'))
+    _add_column_if_missing('user', 'calendar_token', 'VARCHAR(64)')
+    db.session.execute(db.text('CREATE UNIQUE INDEX IF NOT EXISTS ix_user_calendar_token ON "user" (calendar_token)'))
+
+@migration(8, 'indexes for foreign keys and hot queries')
+def _migrate_indexes():
+    # Key/value and coordinator rows were never deduplicated on write; as above, the earliest row is kept.
+    _drop_duplicates(UserMeta, UserMeta.user_id, UserMeta.key)
+    _drop_duplicates(EventMeta, EventMeta.event_id, EventMeta.key)
+    _drop_duplicates(EventCoordinator, EventCoordinator.event_id, EventCoordinator.user_id)
+    for table, name in [
+        ('event', 'ix_event_status_date'), ('event', 'ix_event_date'), ('event', 'ix_event_category_date'),
+        ('event', 'ix_event_created_by'), ('event_registration', 'ix_registration_user_status'),
+        ('waitlist', 'ix_waitlist_event_position'), ('comment', 'ix_comment_event_created'),
+        ('schedule', 'ix_schedule_event_start'), ('user_meta', 'uq_user_meta_user_key'),
+        ('event_meta', 'uq_event_meta_event_key'), ('event_coordinator', 'uq_event_coordinator_event_user'),
+        ('event_coordinator', 'ix_event_coordinator_user'), ('event_attachment', 'ix_event_attachment_event'),
+        ('password_reset_token', 'ix_password_reset_token_user'),
+        ('email_verification_token', 'ix_email_verification_user_verified'),
+        ('announcement', 'ix_announcement_starts_at'), ('user', 'ix_user_role'),
+    ]:
+        _create_index_if_missing(table, name)
+
+@migration(9, 'content-addressed event attachments')
+def _migrate_attachment_hashes():
+    _add_column_if_missing('event_attachment', 'sha256', 'VARCHAR(64)')
+    _add_column_if_missing('event_attachment', 'size', 'INTEGER')
+
+@migration(10, 'attachment content types')
+def _migrate_attachment_content_types():
+    _add_column_if_missing('event_attachment', 'content_type', 'VARCHAR(100)')
+    for attachment_id, filename in db.session.execute(db.text(
+            'SELECT id, filename FROM event_attachment WHERE content_type IS NULL')).all():
+        db.session.execute(db.text('UPDATE event_attachment SET content_type = :type WHERE id = :id'),
+                           {'type': guess_content_type(filename), 'id': attachment_id})
+
+
+_search_backends = {}
+
+def search_backend():
+    """'fts5' or 'tsvector' when the database has a full-text index for events, else None (ILIKE fallback)."""
+    key = str(db.engine.url)
+    if key not in _search_backends:
+        inspector = db.inspect(db.engine)
+        backend = None
+        if db.engine.dialect.name == 'sqlite' and inspector.has_table('event_fts'):
+            backend = 'fts5'
+        elif db.engine.dialect.name == 'postgresql' and 'search_vector' in {c['name'] for c in inspector.get_columns('event')}:
+            backend = 'tsvector'
+        _search_backends[key] = backend
+    return _search_backends[key]
+
+def search_events(query, text):
+    """Restrict an Event query to full-text matches for `text`.
+
+    Every word must match as a word prefix, so partial words typed into the
+    search box already find results.
+    Returns (query, rank) where ordering by `rank` puts the best matches first;
+    rank is None on databases without a full-text index.
+    """
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return query.filter(db.false()), None
+    backend = search_backend()
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        hits = db.text(
+            'SELECT rowid AS event_id, bm25(event_fts, 10.0, 1.0, 3.0, 5.0) AS rank '
+            'FROM event_fts WHERE event_fts MATCH :match'
+        ).bindparams(match=match).columns(event_id=db.Integer, rank=db.Float).subquery('search_hits')
+    elif backend == 'tsvector':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        hits = db.text(
+            "SELECT id AS event_id, -ts_rank(search_vector, to_tsquery('simple', :tsquery)) AS rank "
+            "FROM event WHERE search_vector @@ to_tsquery('simple', :tsquery)"
+        ).bindparams(tsquery=tsquery).columns(event_id=db.Integer, rank=db.Float).subquery('search_hits')
+    else:
+        return ilike_search_events(query, text), None
+    return query.join(hits, Event.id == hits.c.event_id), hits.c.rank
+
+def ilike_search_events(query, text):
+    like = f"%{text}%"
+    return query.filter(
+        db.or_(
+            Event.title.ilike(like),
+            Event.description.ilike(like),
+            Event.location.ilike(like),
+            Event.category.ilike(like)
+        )
+    )
+
+
+LEGACY_QR_NOTE = re.compile(r'qr:([0-9a-fA-F-]{32,36})')
+
+def ticket_signature(token):
+    key = app.config.get('TICKET_SIGNING_KEY')
+    if not key:
+        return None
+    digest = hmac.new(key.encode(), token.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:12]).decode()
+
+def ticket_code(token):
+    """The value printed in the QR code and used in ticket URLs: `<token>.<signature>`."""
+    signature = ticket_signature(token)
+    return f'{token}.{signature}' if signature else token
+
+def verify_ticket_code(code):
+    """Return the ticket token for a scanned code, or None if the signature does not check out."""
+    token, _, signature = code.partition('.')
+    if not signature:
+        return None if app.config.get('TICKET_REQUIRE_SIGNATURE') else token
+    expected = ticket_signature(token)
+    if expected is None or not hmac.compare_digest(expected, signature):
+        return None
+    return token
+
+def issue_ticket(registration):
+    if registration.ticket is None:
+        registration.ticket = Ticket(token=str(uuid.uuid4()))
+    return registration.ticket
+
+
+def register_for_event(event, user_id):
+    """Register a user for an event, or waitlist them if it is full, as one atomic operation.
+
+    The seat is claimed with a conditional UPDATE on the event row
+    (registration_count < max_participants). That statement also takes the row's
+    write lock on both SQLite and PostgreSQL, so the duplicate checks and the
+    waitlist position that follow cannot race with another worker. The unique
+    (event_id, user_id) indexes are the last line of defence.
+
+    The claim must be the first statement of its transaction (SQLite cannot
+    safely upgrade a read transaction that another writer has overtaken), so
+    the read-only transaction opened by the request is ended first. Nothing else
+    is committed: the caller adds its notifications and commits once, and any
+    early exit has already been rolled back.
+
+    Returns (outcome, row): 'registered' with the EventRegistration,
+    'waitlisted' with the Waitlist entry, or 'already_registered' /
+    'already_waitlisted' with None.
+    """
+    event_id = event.id
+    status = 'registered' if event.require_approval else 'confirmed'
+    db.session.commit()
+
+    claimed = db.session.execute(
+        db.update(Event)
+        .where(Event.id == event_id, Event.registration_count < Event.max_participants)
+        .values(registration_count=Event.registration_count + 1,
+                confirmed_count=Event.confirmed_count + int(status == 'confirmed'))
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    if claimed:
+        mark_event_changed(event_id)
+        db.session.info['homepage_changed'] = True  # it shows seats taken
+    else:
+        adjust_event_counters(event_id, waitlist_count=1)
+
+    registration = EventRegistration.query.filter_by(event_id=event_id, user_id=user_id).first()
+    if registration and registration.status != 'cancelled':
+        db.session.rollback()
+        return 'already_registered', None
+    existing_wait = Waitlist.query.filter_by(event_id=event_id, user_id=user_id).first()
+
+    try:
+        if claimed:
+            if registration:
+                registration.status = status
+                registration.registration_date = datetime.utcnow()
+            else:
+                registration = EventRegistration(event_id=event_id, user_id=user_id, status=status)
+                db.session.add(registration)
+            issue_ticket(registration)
+            if existing_wait:
+                db.session.delete(existing_wait)
+                adjust_event_counters(event_id, waitlist_count=-1)
+            db.session.flush()
+            return 'registered', registration
+
+        if existing_wait:
+            db.session.rollback()
+            return 'already_waitlisted', None
+        position = (db.session.query(db.func.max(Waitlist.position)).filter_by(event_id=event_id).scalar() or 0) + 1
+        wait = Waitlist(event_id=event_id, user_id=user_id, position=position)
+        db.session.add(wait)
+        db.session.flush()
+        return 'waitlisted', wait
+    except IntegrityError:
+        db.session.rollback()
+        return ('already_registered' if claimed else 'already_waitlisted'), None
+
+
+def lock_event(event_id):
+    """Start a write transaction holding an event's row lock; return the event, re-read under it.
+
+    SQLite ignores SELECT ... FOR UPDATE, and a transaction that has read cannot
+    safely upgrade to a write once another writer has overtaken it. So, as in
+    register_for_event, the read-only transaction opened by the request is ended
+    and the new one starts with a no-op UPDATE of the event row: the write lock on
+    SQLite, the row lock on PostgreSQL. Call it before reading whatever the write
+    depends on, and before anything in this transaction has been changed.
+    Returns None if the event is gone.
+    """
+    db.session.commit()
+    db.session.execute(
+        db.update(Event).where(Event.id == event_id).values(id=Event.id)
+        .execution_options(synchronize_session=False)
+    )
+    return Event.query.filter_by(id=event_id).populate_existing().first()
+
+
+def promote_waitlist(event_id, actor_id=None):
+    """Move the front of an event's waitlist into its free seats. Returns how many were seated.
+
+    Everything is set-based: the lowest positions are promoted in one batch
+    (registrations reactivated or bulk-inserted, tickets and notifications
+    bulk-inserted, waitlist rows deleted) and the remaining positions are
+    renumbered 1..n, all in the caller's transaction. The caller takes the event's
+    lock first (lock_event) so two promotions cannot hand out the same seat, and
+    commits.
+    """
+    event = Event.query.filter_by(id=event_id).populate_existing().first()
+    if not event:
+        return 0
+    free = event.max_participants - event.registration_count
+    if free <= 0:
+        return 0
+    front = db.session.query(Waitlist.id, Waitlist.user_id).filter_by(event_id=event_id).order_by(
+        Waitlist.position, Waitlist.id
+    ).limit(free).all()
+    if not front:
+        return 0
+
+    user_ids = [user_id for _, user_id in front]
+    existing = dict(db.session.query(EventRegistration.user_id, EventRegistration.status).filter(
+        EventRegistration.event_id == event_id, EventRegistration.user_id.in_(user_ids)
+    ).all())
+    seated = [uid for uid in user_ids if existing.get(uid, 'cancelled') == 'cancelled']
+    status = 'registered' if event.require_approval else 'confirmed'
+    now = datetime.utcnow()
+
+    reactivated = [uid for uid in seated if uid in existing]
+    if reactivated:
+        EventRegistration.query.filter(
+            EventRegistration.event_id == event_id, EventRegistration.user_id.in_(reactivated)
+        ).update({EventRegistration.status: status, EventRegistration.registration_date: now}, synchronize_session=False)
+    new_rows = [{'event_id': event_id, 'user_id': uid, 'status': status, 'registration_date': now}
+                for uid in seated if uid not in existing]
+    if new_rows:
+        db.session.execute(db.insert(EventRegistration), new_rows)
+    if seated:
+        unticketed = db.session.query(EventRegistration.id).outerjoin(
+            Ticket, Ticket.registration_id == EventRegistration.id
+        ).filter(EventRegistration.event_id == event_id, EventRegistration.user_id.in_(seated), Ticket.id.is_(None))
+        tickets = [{'registration_id': reg_id, 'token': str(uuid.uuid4()), 'created_at': now} for (reg_id,) in unticketed]
+        if tickets:
+            db.session.execute(db.insert(Ticket), tickets)
+        notify_many([
+            {'user_id': uid, 'title': 'Off the waitlist', 'created_at': now,
+             'body': f'A seat opened up and you are now registered for {event.title}.'}
+            for uid in seated
+        ])
+        db.session.add(AuditLog(actor_id=actor_id, action='promote_waitlist', object_type='event', object_id=event_id,
+                                snapshot=f"users={','.join(map(str, seated))}"))
+
+    Waitlist.query.filter(Waitlist.id.in_([wid for wid, _ in front])).delete(synchronize_session=False)
+    adjust_event_counters(event_id, registration_count=len(seated),
+                          confirmed_count=len(seated) if status == 'confirmed' else 0,
+                          waitlist_count=-len(front))
+    compact_waitlist(event_id)
+    return len(seated)
+
+def compact_waitlist(event_id):
+    """Renumber an event's waitlist positions to 1..n, keeping their order, in one UPDATE."""
+    ranked = db.select(
+        Waitlist.id,
+        db.func.row_number().over(order_by=(Waitlist.position, Waitlist.id)).label('rank')
+    ).where(Waitlist.event_id == event_id).subquery()
+    db.session.execute(
+        db.update(Waitlist).where(Waitlist.id == ranked.c.id).values(position=ranked.c.rank)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def adjust_event_counters(event_id, **deltas):
+    """Apply counter deltas (e.g. registration_count=1) to an event in the current transaction.
+
+    The update is a single `SET col = col + :delta` so concurrent requests never lose
+    increments. The caller is responsible for committing.
+    """
+    values = {getattr(Event, name): getattr(Event, name) + delta for name, delta in deltas.items() if delta}
+    if values:
+        Event.query.filter_by(id=event_id).update(values, synchronize_session=False)
+        mark_event_changed(event_id)
+        if deltas.get('registration_count'):
+            db.session.info['homepage_changed'] = True  # the only counter it shows
+
+def notify(user_id, title, body=None):
+    """Add a notification for a user and bump their unread counter, in the caller's transaction."""
+    notification = Notification(user_id=user_id, title=title, body=body)
+    db.session.add(notification)
+    adjust_unread_notifications(user_id, 1)
+    publish(f'user:{user_id}', 'notification', {'title': title, 'body': body})
+    return notification
+
+def notify_many(rows):
+    """Bulk-insert notification dicts (user_id, title, body, ...) and bump the unread counters."""
+    if not rows:
+        return
+    db.session.execute(db.insert(Notification), rows)
+    db.session.execute(db.insert(ChangeLog), [
+        {'channel': f"user:{row['user_id']}", 'kind': 'notification', 'created_at': datetime.utcnow(),
+         'payload': json.dumps({'title': row['title'], 'body': row.get('body')})}
+        for row in rows
+    ])
+    per_user = {}
+    for row in rows:
+        per_user[row['user_id']] = per_user.get(row['user_id'], 0) + 1
+    by_delta = {}
+    for user_id, delta in per_user.items():
+        by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        User.query.filter(User.id.in_(user_ids)).update(
+            {User.unread_notifications: User.unread_notifications + delta}, synchronize_session=False)
+        for user_id in user_ids:
+            nav_notifications_cache.invalidate(user_id)
+
+def adjust_unread_notifications(user_id, delta):
+    if delta:
+        User.query.filter_by(id=user_id).update(
+            {User.unread_notifications: User.unread_notifications + delta}, synchronize_session=False)
+    nav_notifications_cache.invalidate(user_id)
+
+def recompute_unread_notifications():
+    """Rebuild every user's unread counter from the notification table, uncommitted. Returns users updated."""
+    unread = db.select(db.func.count(Notification.id)).where(
+        Notification.user_id == User.id, Notification.read_at.is_(None)
+    ).scalar_subquery()
+    updated = User.query.update({User.unread_notifications: unread}, synchronize_session=False)
+    nav_notifications_cache.invalidate()
+    return updated
+
+CHANGELOG_RETENTION = timedelta(hours=1)
+_changelog_pruned_at = time.monotonic()
+
+def prune_changelog(session):
+    """Delete live-feed rows older than CHANGELOG_RETENTION, at most every ten minutes per process.
+
+    Called by the transactions that add feed rows, so the table stays small whether
+    or not anyone in this process is subscribed. Rows that old are never replayed.
+    """
+    global _changelog_pruned_at
+    if time.monotonic() - _changelog_pruned_at < 600:
+        return
+    _changelog_pruned_at = time.monotonic()
+    session.execute(db.delete(ChangeLog).where(ChangeLog.created_at < datetime.utcnow() - CHANGELOG_RETENTION)
+                    .execution_options(synchronize_session=False))
+
+def publish(channel, kind, data):
+    """Add a change to the live feed; subscribers see it once the caller's transaction commits."""
+    db.session.add(ChangeLog(channel=channel, kind=kind, payload=json.dumps(data)))
+    prune_changelog(db.session)
+
+def mark_event_changed(event_id):
+    """Publish the event's seat counts when the current transaction commits (once per event)."""
+    db.session.info.setdefault('changed_events', set()).add(event_id)
+
+def event_counts(event_id):
+    row = db.session.query(Event.registration_count, Event.max_participants, Event.waitlist_count,
+                           Event.confirmed_count).filter_by(id=event_id).first()
+    if row is None:
+        return None
+    return {'registration_count': row[0], 'max_participants': row[1], 'waitlist_count': row[2],
+            'confirmed_count': row[3], 'available': max(row[1] - row[0], 0)}
+
+@sa_event.listens_for(SASession, 'before_commit')
+def _publish_changed_events(session):
+    changed = session.info.pop('changed_events', None)
+    if not changed:
+        return
+    rows = session.query(Event.id, Event.registration_count, Event.max_participants, Event.waitlist_count,
+                         Event.confirmed_count).filter(Event.id.in_(changed)).all()
+    now = datetime.utcnow()
+    session.execute(db.insert(ChangeLog), [
+        {'channel': f'event:{eid}', 'kind': 'counts', 'created_at': now, 'payload': json.dumps({
+            'registration_count': reg, 'max_participants': cap, 'waitlist_count': wait,
+            'confirmed_count': conf, 'available': max(cap - reg, 0)})}
+        for eid, reg, cap, wait, conf in rows
+    ])
+    prune_changelog(session)
+
+CALENDAR_FIELDS = ('title', 'description', 'event_date', 'location', 'status')
+
+@sa_event.listens_for(SASession, 'before_flush')
+def _touch_events(session, flush_context, instances):
+    # Counter bumps are bulk UPDATEs and never pass through here, so they don't invalidate feeds.
+    for obj in session.dirty:
+        if isinstance(obj, Event) and any(db.inspect(obj).attrs[f].history.has_changes() for f in CALENDAR_FIELDS):
+            obj.updated_at = datetime.utcnow()
+
+# What the homepage renders or filters on; seat counts are flagged by the counter updates themselves.
+HOMEPAGE_EVENT_FIELDS = ('title', 'description', 'category', 'event_date', 'location', 'max_participants', 'status')
+
+def _shown_on_homepage(obj, new_or_deleted):
+    if isinstance(obj, Announcement):
+        return True
+    if not isinstance(obj, Event):
+        return False
+    return new_or_deleted or any(db.inspect(obj).attrs[f].history.has_changes() for f in HOMEPAGE_EVENT_FIELDS)
+
+@sa_event.listens_for(SASession, 'before_flush')
+def _note_homepage_writes(session, flush_context, instances):
+    if (any(_shown_on_homepage(obj, True) for obj in (*session.new, *session.deleted))
+            or any(_shown_on_homepage(obj, False) for obj in session.dirty)):
+        session.info['homepage_changed'] = True
+
+@sa_event.listens_for(SASession, 'after_commit')
+def _bump_homepage_version(session):
+    # After the commit, so the signal never sits inside (or holds up) the write transaction.
+    if session.info.pop('homepage_changed', False):
+        bump_content_version()
+
+@sa_event.listens_for(SASession, 'after_rollback')
+def _forget_changed_events(session):
+    session.info.pop('changed_events', None)
+    session.info.pop('homepage_changed', None)
+
+
+class ChangeBroker:
+    """Tails ChangeLog and fans new rows out to this process's /stream subscribers.
+
+    One background thread per process polls the table only while someone is
+    subscribed, so the cost is one indexed query per poll interval however many
+    clients are connected. Ids can commit slightly out of order on PostgreSQL, so
+    each poll re-reads a small window below the highest id seen and skips rows it
+    has already delivered.
+    """
+
+    LOOKBACK = 200
+
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_id = None
+        self._delivered = set()
+
+    def subscribe(self, channels):
+        q = queue.Queue(maxsize=1000)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='change-broker', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q, channels):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(q)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def _run(self):
+        with app.app_context():
+            while True:
+                with self._lock:
+                    idle = not self._subscribers
+                if idle:
+                    self._last_id = None  # reconnecting clients replay what they missed via Last-Event-ID
+                else:
+                    try:
+                        self._poll()
+                    except OperationalError:
+                        db.session.rollback()  # locked or briefly unavailable: try again next round
+                time.sleep(self.poll_interval)
+
+    def _poll(self):
+        if self._last_id is None:
+            self._last_id = db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+            db.session.commit()
+            return
+        floor = self._last_id - self.LOOKBACK
+        rows = ChangeLog.query.filter(ChangeLog.id > floor).order_by(ChangeLog.id).limit(1000).all()
+        db.session.commit()
+        for row in rows:
+            if row.id in self._delivered:
+                continue
+            self._delivered.add(row.id)
+            self._last_id = max(self._last_id, row.id)
+            with self._lock:
+                subscribers = list(self._subscribers.get(row.channel, ()))
+            for q in subscribers:
+                try:
+                    q.put_nowait((row.id, row.kind, row.payload))
+                except queue.Full:
+                    pass  # a stalled client; it will resync from Last-Event-ID when it reconnects
+        self._delivered = {i for i in self._delivered if i > self._last_id - self.LOOKBACK}
+
+change_broker = ChangeBroker()
+_sse_slots = threading.BoundedSemaphore(app.config['SSE_MAX_CONNECTIONS'])
+
+def format_sse(event_id, kind, payload):
+    return f'id: {event_id}\nevent: {kind}\ndata: {payload}\n\n'
+
+
+OUTBOX_BATCH_SIZE = 200
+_outbox_wakeup = threading.Event()
+
+def enqueue_fanout(key, title, body=None, event_id=None, user_ids=(), exclude=(), audit=None):
+    """Queue notifications (and optionally one audit entry) for delivery by the outbox worker.
+
+    Recipients are `user_ids` plus, when `event_id` is given, that event's creator and
+    coordinators, minus `exclude`. They are resolved at delivery time, so the request
+    writes one small row however many people are notified. `key` makes the enqueue
+    idempotent: a second message with the same key is ignored. The caller commits.
+    """
+    payload = {'title': title, 'body': body, 'event_id': event_id,
+               'user_ids': list(user_ids), 'exclude': list(exclude), 'audit': audit}
+    try:
+        with db.session.begin_nested():
+            db.session.add(OutboxMessage(idempotency_key=key, payload=json.dumps(payload)))
+    except IntegrityError:
+        return False
+    _outbox_wakeup.set()
+    return True
+
+def process_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Deliver one batch of pending outbox messages. Returns how many were delivered.
+
+    Delivery is at-least-once with an exactly-once effect: a message is claimed by
+    setting processed_at, and that claim commits in the same transaction as the rows
+    it produces. A crash rolls both back and the message is picked up again. If the
+    batch fails, messages are retried one at a time so one bad message cannot block
+    the rest. Failed messages back off exponentially, capped at five minutes.
+    """
+    now = datetime.utcnow()
+    ids = [mid for (mid,) in db.session.query(OutboxMessage.id).filter(
+        OutboxMessage.processed_at.is_(None), OutboxMessage.available_at <= now
+    ).order_by(OutboxMessage.id).limit(batch_size)]
+    db.session.commit()  # end the read transaction before claiming (see register_for_event)
+    if not ids:
+        return 0
+    try:
+        return _deliver_outbox(ids)
+    except Exception:
+        db.session.rollback()
+        if len(ids) == 1:
+            _record_outbox_failure(ids[0])
+            return 0
+    delivered = 0
+    for message_id in ids:
+        try:
+            delivered += _deliver_outbox([message_id])
+        except Exception:
+            db.session.rollback()
+            _record_outbox_failure(message_id)
+    return delivered
+
+def _deliver_outbox(ids):
+    now = datetime.utcnow()
+    claimed = [mid for mid in ids if OutboxMessage.query.filter(
+        OutboxMessage.id == mid, OutboxMessage.processed_at.is_(None)
+    ).update({OutboxMessage.processed_at: now}, synchronize_session=False) == 1]
+    if not claimed:
+        db.session.commit()
+        return 0
+    messages = db.session.query(OutboxMessage.id, OutboxMessage.payload, OutboxMessage.created_at).filter(
+        OutboxMessage.id.in_(claimed)).all()
+    payloads = [(json.loads(payload), created_at) for _, payload, created_at in messages]
+
+    event_ids = {p['event_id'] for p, _ in payloads if p.get('event_id')}
+    staff = {}
+    if event_ids:
+        for event_id, creator_id in db.session.query(Event.id, Event.created_by).filter(Event.id.in_(event_ids)):
+            staff.setdefault(event_id, set()).add(creator_id)
+        for event_id, user_id in db.session.query(EventCoordinator.event_id, EventCoordinator.user_id).filter(
+                EventCoordinator.event_id.in_(event_ids)):
+            staff.setdefault(event_id, set()).add(user_id)
+
+    notifications, audits = [], []
+    for payload, created_at in payloads:
+        recipients = set(payload.get('user_ids') or [])
+        if payload.get('event_id'):
+            recipients |= staff.get(payload['event_id'], set())
+        recipients -= set(payload.get('exclude') or [])
+        notifications.extend({'user_id': uid, 'title': payload['title'], 'body': payload.get('body'),
+                              'created_at': created_at} for uid in sorted(recipients))
+        if payload.get('audit'):
+            audits.append(dict(payload['audit'], created_at=created_at))
+    for i in range(0, len(notifications), IMPORT_CHUNK_SIZE):
+        notify_many(notifications[i:i + IMPORT_CHUNK_SIZE])
+    if audits:
+        db.session.execute(db.insert(AuditLog), audits)
+    db.session.commit()
+    return len(claimed)
+
+def _record_outbox_failure(message_id):
+    message = db.session.get(OutboxMessage, message_id)
+    if message is None or message.processed_at is not None:
+        return
+    message.attempts += 1
+    message.last_error = traceback.format_exc(limit=5)
+    message.available_at = datetime.utcnow() + timedelta(seconds=min(2 ** message.attempts, 300))
+    db.session.commit()
+    print(f"Outbox message {message_id} failed (attempt {message.attempts}); retrying later")
+
+def prune_outbox(older_than=timedelta(days=7)):
+    deleted = OutboxMessage.query.filter(
+        OutboxMessage.processed_at < datetime.utcnow() - older_than
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def run_outbox_worker(interval=1.0, batch_size=OUTBOX_BATCH_SIZE, once=False):
+    """Deliver outbox messages until stopped (or until the queue is empty, with once=True)."""
+    last_prune = 0.0
+    while True:
+        try:
+            delivered = process_outbox(batch_size)
+        except OperationalError as e:
+            db.session.rollback()
+            print(f"Outbox worker: database error, retrying: {e}")
+            delivered = 0
+        if delivered:
+            continue
+        if once:
+            return
+        if time.monotonic() - last_prune > 3600:
+            prune_outbox()
+            last_prune = time.monotonic()
+        _outbox_wakeup.wait(interval)
+        _outbox_wakeup.clear()
+
+_outbox_thread = None
+_outbox_thread_lock = threading.Lock()
+
+def start_outbox_thread():
+    """Start this process's background outbox worker, once."""
+    global _outbox_thread
+    with _outbox_thread_lock:
+        if _outbox_thread is not None and _outbox_thread.is_alive():
+            return
+        def work():
+            with app.app_context():
+                run_outbox_worker()
+        _outbox_thread = threading.Thread(target=work, name='outbox-worker', daemon=True)
+        _outbox_thread.start()
+
+def recompute_event_counters(event_id=None):
+    """Rebuild the denormalized counters from the underlying rows, uncommitted. Returns the number of events updated."""
+    def count_of(column, *criteria):
+        return db.select(db.func.count(column)).where(*criteria).scalar_subquery()
+
+    values = {
+        Event.registration_count: count_of(EventRegistration.id, EventRegistration.event_id == Event.id, EventRegistration.status != 'cancelled'),
+        Event.confirmed_count: count_of(EventRegistration.id, EventRegistration.event_id == Event.id, EventRegistration.status == 'confirmed'),
+        Event.waitlist_count: count_of(Waitlist.id, Waitlist.event_id == Event.id),
+        Event.checkin_count: count_of(CheckIn.id, CheckIn.event_id == Event.id),
+    }
+    query = Event.query
+    if event_id is not None:
+        query = query.filter_by(id=event_id)
+    return query.update(values, synchronize_session=False)
+
+def paginate_keyset(query, keys, cursor=None, per_page=25):
+    """Keyset ("seek") pagination: page through `query` without OFFSET.
+
+    `keys` lists (column, descending) pairs and must end in a unique column, e.g.
+    [(Event.event_date, False), (Event.id, False)]; the query is ordered by them.
+    `cursor` is the opaque string returned for the previous page; a malformed
+    one is a 400. Returns (items, next_cursor) with next_cursor None on the
+    last page.
+    """
+    columns = [column for column, _ in keys]
+    try:
+        values = decode_cursor(cursor, columns)
+    except ValueError:
+        abort(400, 'Invalid page cursor')
+    if values is not None:
+        query = query.filter(_keyset_after(keys, values))
+    query = query.order_by(None).order_by(*[c.desc() if desc else c.asc() for c, desc in keys])
+    rows = query.add_columns(*columns).limit(per_page + 1).all()
+    items = [row[0] for row in rows[:per_page]]
+    next_cursor = encode_cursor(rows[per_page - 1][1:]) if len(rows) > per_page else None
+    return items, next_cursor
+
+def _keyset_after(keys, values):
+    directions = {desc for _, desc in keys}
+    if len(directions) == 1:
+        # Row-value comparison lets the database seek straight into a composite index.
+        left, right = db.tuple_(*[c for c, _ in keys]), db.tuple_(*values)
+        return left < right if directions.pop() else left > right
+    clauses = []
+    for i, (column, desc) in enumerate(keys):
+        equal = [c == v for (c, _), v in zip(keys[:i], values[:i])]
+        clauses.append(db.and_(*equal, column < values[i] if desc else column > values[i]))
+    return db.or_(*clauses)
+
+def encode_cursor(values):
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Sort-key values from a cursor, or None if there is none (first page).
+
+    The cursor comes from the URL, so each value is checked against its column's
+    type; anything else (bad base64, nested lists, a string for an integer key)
+    raises ValueError rather than reaching the database.
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('malformed cursor') from e
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError('malformed cursor')
+    return [_cursor_value(value, column.type.python_type) for value, column in zip(payload, columns)]
+
+def _cursor_value(value, expected):
+    if value is None:
+        return None
+    if expected is datetime and isinstance(value, dict) and isinstance(value.get('dt'), str):
+        value = datetime.fromisoformat(value['dt'])
+        fits = value.tzinfo is None
+    elif expected is float and type(value) in (int, float):
+        value, fits = float(value), True
+    elif expected is int:
+        fits = type(value) is int and -2 ** 63 <= value < 2 ** 63  # not bool, and fits a BIGINT
+    else:
+        fits = isinstance(value, expected)
+    if not fits:
+        raise ValueError(f'cursor value {value!r} does not fit a {expected.__name__} column')
+    return value
+
+
+CACHES = {}
+
+class TTLCache:
+    """A small thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    Per process: every gunicorn worker has its own copy, so anything cached must
+    tolerate being up to `ttl` seconds stale in other workers. Instances register
+    themselves in CACHES so their hit/miss counters can be reported.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': round(self.hits / lookups, 4) if lookups else None}
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def process_pool():
+    """This process's shared pool for CPU-bound work, created on first use.
+
+    Its processes are started by a forkserver (spawn where that is unavailable), never
+    forked from the web worker itself: the worker runs other threads (change broker,
+    outbox, QR prerender) and a forked child would inherit any lock one of them held at
+    that moment (logging, the connection pool, SQLite) with nobody left to release it.
+    Workers import the app once and are then reused by every request. A pool broken
+    by a crashed child is replaced.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None or getattr(_process_pool, '_broken', False):
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _process_pool = ProcessPoolExecutor(max_workers=app.config['PROCESS_POOL_WORKERS'],
+                                                mp_context=multiprocessing.get_context(method))
+        return _process_pool
+
+user_cache = TTLCache('users', maxsize=10000, ttl=app.config['USER_CACHE_TTL'])
+# Columns that change without a version bump stay out of the cache and load when a page uses them.
+_USER_COLUMNS = [c.key for c in User.__table__.columns if c.key not in ('unread_notifications', 'calendar_token')]
+nav_notifications_cache = TTLCache('nav_notifications', maxsize=10000, ttl=app.config['NAV_NOTIFICATIONS_TTL'])
+
+def bump_user_version(user):
+    """Mark a user as changed (role, password): cached copies are reloaded and older sessions are logged out."""
+    user.version = (user.version or 0) + 1
+    user_cache.invalidate(user.id)
+
+
 def ensure_database_initialized():
 
     db.create_all()
+    run_migrations()
     admin = User.query.filter_by(role='admin').first()
     if not admin:
         admin = User(
@@ -187,22 +1477,237 @@ def ensure_database_initialized():
         db.session.commit()
 
 
-with app.app_context():
+# Static assets: `flask build-assets` copies every file under static/ to static/dist/ with a content
+# hash in its name, plus .gz/.br siblings for text files, and writes a manifest. url_for('static', ...)
+# then links to the hashed copy, which never changes and so is cached for a year.
+STATIC_DIST = 'dist'
+STATIC_COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html')
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+def build_assets(static_folder):
+    """Fingerprint and precompress the static files; return [(source, built, size, gzip size, brotli size)].
+
+    Old builds are left in place, so pages rendered before a deploy still find their
+    assets. Brotli variants need the `brotli` package and are skipped without it.
+    """
+    dist = os.path.join(static_folder, STATIC_DIST)
+    manifest, built = {}, []
+    for root, dirs, names in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d != STATIC_DIST]
+        for name in sorted(names):
+            source = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            with open(os.path.join(root, name), 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(source)
+            target = f'{STATIC_DIST}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            variants = {'': data}
+            if ext in STATIC_COMPRESSIBLE:
+                variants['.gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+                if brotli:
+                    variants['.br'] = brotli.compress(data, quality=11)
+            path = os.path.join(static_folder, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for suffix, body in variants.items():
+                if suffix and len(body) >= len(data):
+                    continue
+                tmp = f'{path}{suffix}.{uuid.uuid4().hex}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp, path + suffix)
+            manifest[source] = target
+            built.append((source, target, len(data), len(variants.get('.gz', data)), len(variants.get('.br', data))))
+    os.makedirs(dist, exist_ok=True)
+    tmp = os.path.join(dist, f'manifest.json.{uuid.uuid4().hex}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(dist, 'manifest.json'))
+    return built
+
+def load_asset_manifest():
     try:
-        ensure_database_initialized()
-        print("Database initialized successfully")
-    except Exception as e:
-        print(f"Database initialization error: {str(e)}")
-
-        try:
-            db.create_all()
-            print("Tables created successfully")
-        except Exception as e2:
-            print(f"Table creation error: {str(e2)}")
+        with open(os.path.join(app.static_folder, STATIC_DIST, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Read once per process; without a build, static URLs stay unhashed and uncached as before.
+asset_manifest = load_asset_manifest()
+
+@app.url_defaults
+def _fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in asset_manifest:
+        values['filename'] = asset_manifest[values['filename']]
+
+def serve_static(filename):
+    """Flask's static view, except that fingerprinted files are sent precompressed and cached for a year."""
+    if not filename.startswith(STATIC_DIST + '/') or not FINGERPRINTED.search(filename):
+        return app.send_static_file(filename)
+    path = safe_join(app.static_folder, filename)
+    if path is None:
+        abort(404)
+    suffix, encoding = '', None
+    for candidate, name in (('.br', 'br'), ('.gz', 'gzip')):
+        if request.accept_encodings[name] and os.path.isfile(path + candidate):
+            suffix, encoding = candidate, name
+            break
+    response = send_from_directory(app.static_folder, filename + suffix, max_age=31536000,
+                                   mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+app.view_functions['static'] = serve_static
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables, apply pending migrations and make sure an admin account exists."""
+    ensure_database_initialized()
+    print("Database initialized successfully")
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static files into static/dist; run before starting the web processes."""
+    for source, target, size, gzipped, brotlied in build_assets(app.static_folder):
+        print(f"{source} -> {target}: {size} bytes, gzip {gzipped}, brotli {brotlied}")
+    print(f"Manifest written to {os.path.join(app.static_folder, STATIC_DIST, 'manifest.json')}")
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Resolve the session's `<id>:<version>` to a User, or None (logged out) if the user has changed since.
+
+    A user in user_cache is rebuilt from the cached columns without any query and
+    merged into the request's session without a SELECT, so relationships still
+    lazy-load as usual. The cache is per process: the worker that changes a role or
+    password drops its copy at once, the others when their entry expires, so there a
+    demotion or a logout can take up to USER_CACHE_TTL seconds to apply.
+
+    On a miss the user is loaded from the database. A session whose version the
+    primary confirms is out of date (password reset, role change) is ended; the
+    replica alone is not trusted with that, as it may not have the new version yet.
+    Sessions from before versions were stamped hold a bare id: they are loaded from
+    the database and stamped with the current version.
+    """
+    uid, stamped, version = user_id.partition(':')
+    try:
+        uid, version = int(uid), int(version) if stamped else None
+    except ValueError:
+        return None
+    cached = user_cache.get(uid)
+    if cached is not None and cached['version'] == version:
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, uid)
+    if user is not None and version is not None and user.version != version:
+        user = db.session.get(User, uid, populate_existing=True, bind_arguments={'bind': db.engine})
+        if user is not None and user.version != version:
+            return None
+    if user is None:
+        return None
+    if version is None:
+        session['_user_id'] = user.get_id()
+    user_cache.set(uid, {key: getattr(user, key) for key in _USER_COLUMNS})
+    return user
+
+
+@app.cli.command('recount-registrations')
+@click.option('--event-id', type=int, default=None, help='Only repair this event.')
+def recount_registrations_command(event_id):
+    """Recompute Event registration/confirmed/waitlist/check-in counters."""
+    updated = recompute_event_counters(event_id)
+    db.session.commit()
+    print(f"Recomputed counters for {updated} event(s)")
+
+
+@app.cli.command('recount-notifications')
+def recount_notifications_command():
+    """Recompute every user's unread notification counter."""
+    updated = recompute_unread_notifications()
+    db.session.commit()
+    print(f"Recomputed unread notification counters for {updated} user(s)")
+
+
+@app.cli.command('outbox-worker')
+@click.option('--interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty.')
+@click.option('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+@click.option('--once', is_flag=True, help='Drain the outbox and exit.')
+def outbox_worker_command(interval, batch_size, once):
+    """Deliver queued notification fan-outs (use with OUTBOX_WORKER=external)."""
+    print("Outbox worker started")
+    run_outbox_worker(interval=interval, batch_size=batch_size, once=once)
+
+
+@app.cli.command('prerender-tickets')
+@click.option('--event-id', type=int, default=None, help='Only this event.')
+def prerender_tickets_command(event_id):
+    """Render every active ticket's QR code into the image cache (e.g. the night before an event)."""
+    query = db.session.query(Ticket.token).join(EventRegistration, Ticket.registration_id == EventRegistration.id).filter(
+        EventRegistration.status != 'cancelled')
+    if event_id is not None:
+        query = query.filter(EventRegistration.event_id == event_id)
+    count = 0
+    for (token,) in query.execution_options(yield_per=1000):
+        qr_cache.get(ticket_code(token))
+        count += 1
+    print(f"Rendered {count} ticket QR code(s); {qr_cache.stats()}")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the event full-text index from the event table (SQLite FTS5 only)."""
+    if search_backend() != 'fts5':
+        print("Nothing to rebuild: PostgreSQL maintains search_vector itself, other databases use ILIKE")
+        return
+    db.session.execute(db.text("INSERT INTO event_fts(event_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    print("Event search index rebuilt")
+
+
+@app.cli.command('promote-waitlists')
+@click.option('--every', type=int, default=0, help='Keep running, sweeping every N seconds.')
+def promote_waitlists_command(every):
+    """Promote waitlisted users into any free seats across all events."""
+    while True:
+        event_ids = [eid for (eid,) in db.session.query(Event.id).filter(
+            Event.waitlist_count > 0, Event.registration_count < Event.max_participants
+        )]
+        db.session.commit()
+        total = 0
+        for event_id in event_ids:
+            lock_event(event_id)
+            total += promote_waitlist(event_id)
+            db.session.commit()
+        print(f"Promoted {total} waitlisted user(s) across {len(event_ids)} event(s)")
+        if not every:
+            break
+        time.sleep(every)
+
+
+def _run_import(what, path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = read_import_csv(f)
+    created, errors = IMPORTERS[what](rows)
+    for line, message in errors:
+        print(f"line {line}: {message}")
+    print(f"Imported {created} {what}, {len(errors)} row(s) skipped")
+
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_users_command(path):
+    """Bulk-create users from a CSV with username,email,password,school[,role] columns."""
+    _run_import('users', path)
+
+
+@app.cli.command('import-registrations')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_registrations_command(path):
+    """Bulk-register users from a CSV with event_id and username (or email) columns."""
+    _run_import('registrations', path)
 
 
 @app.route('/test-db')
@@ -224,40 +1729,427 @@ def test_db():
             'database_uri': app.config['SQLALCHEMY_DATABASE_URI'].replace('://', '://***:***@') if '://' in app.config['SQLALCHEMY_DATABASE_URI'] else 'sqlite'
         }), 500
 
-@app.route('/')
-def index():
-    upcoming_events = Event.query.filter(
-        Event.event_date >= datetime.now(),
-        Event.status == 'upcoming'
-    ).order_by(Event.event_date).limit(6).all()
-    
-    ongoing_events = Event.query.filter(
-        Event.status == 'ongoing'
-    ).all()
-    
+homepage_cache = TTLCache('homepage', maxsize=1, ttl=app.config['HOMEPAGE_CACHE_TTL'])
 
-    for event in upcoming_events:
-        event.registration_count = EventRegistration.query.filter_by(event_id=event.id).count()
-    
-
-    for event in ongoing_events:
-        event.registration_count = EventRegistration.query.filter_by(event_id=event.id).count()
-    
-    events = Event.query.all()  # Fetches a list, not a query object
+def content_version():
+    """The homepage signal file's identity: it changes whenever any worker on this host bumps it."""
+    try:
+        stat = os.stat(app.config['HOMEPAGE_SIGNAL_FILE'])
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def bump_content_version():
+    """Tell every worker that the homepage changed, by replacing the signal file; called after commit.
+
+    Replacing it (rather than rewriting a counter in place) gives each bump a new inode,
+    so two workers bumping at once can never leave a version some reader already cached.
+    """
+    homepage_cache.invalidate()
+    path = app.config['HOMEPAGE_SIGNAL_FILE']
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, path)
+    except OSError as e:  # the write has committed; other workers just fall back to the TTL
+        app.logger.warning('Could not replace homepage signal file %s: %s', path, e)
+
+def _row(obj):
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+def homepage_sections():
+    """The homepage's upcoming events, live events and current announcements, as plain dicts.
+
+    Cached until the content version moves on, the TTL runs out, or the next
+    time-based change: an announcement starting or ending, or the first
+    upcoming event starting. A hit costs one stat() of the signal file and no
+    query. The file is per host, so with several hosts a change made on another
+    one shows after at most HOMEPAGE_CACHE_TTL seconds.
+    """
+    version = content_version()
+    cached = homepage_cache.get('sections')
+    if cached is not None and cached[0] == version and cached[1] > time.monotonic():
+        return cached[2]
+
+    now, now_utc = datetime.now(), datetime.utcnow()
+    upcoming_events = [_row(e) for e in Event.query.filter(
+        Event.event_date >= now,
+        Event.status == 'upcoming'
+    ).order_by(Event.event_date).limit(6)]
+    ongoing_events = [_row(e) for e in Event.query.filter(Event.status == 'ongoing')]
+    announcements = [_row(a) for a in Announcement.query.filter(
+        (Announcement.starts_at <= now_utc),
+        ((Announcement.ends_at == None) | (Announcement.ends_at >= now_utc))
+    ).order_by(Announcement.is_pinned.desc(), Announcement.starts_at.desc())]
+    next_start = db.session.query(db.func.min(Announcement.starts_at)).filter(Announcement.starts_at > now_utc).scalar()
+
+    expires = time.monotonic() + homepage_cache.ttl
+    boundaries = [a['ends_at'] - now_utc for a in announcements if a['ends_at']]
+    if next_start:
+        boundaries.append(next_start - now_utc)
+    if upcoming_events:
+        boundaries.append(upcoming_events[0]['event_date'] - now)
+    if boundaries:
+        expires = min(expires, time.monotonic() + min(b.total_seconds() for b in boundaries))
+    sections = {'upcoming_events': upcoming_events, 'ongoing_events': ongoing_events, 'announcements': announcements}
+    homepage_cache.set('sections', (version, expires, sections))
+    return sections
 
-    now_dt = datetime.utcnow()
-    announcements = Announcement.query.filter(
-        (Announcement.starts_at <= now_dt),
-        ((Announcement.ends_at == None) | (Announcement.ends_at >= now_dt))
-    ).order_by(Announcement.is_pinned.desc(), Announcement.starts_at.desc()).all()
-    return render_template('index.html', upcoming_events=upcoming_events, ongoing_events=ongoing_events, events=events, announcements=announcements)
+@app.route('/')
+def index():
+    return render_template('index.html', **homepage_sections())
+
+def use_primary(view):
+    """Keep a GET view that writes (an approve link, say) off the replica.
+
+    Its checks must see the primary's current state: a lagging replica could show a
+    registration as still pending after it was rejected, and the write would act on that.
+    """
+    view.use_primary = True
+    return view
+
+@app.before_request
+def _route_reads_to_replica():
+    if ('replica' in db.engines and request.method in ('GET', 'HEAD')
+            and not getattr(app.view_functions.get(request.endpoint), 'use_primary', False)
+            and session.get('_primary_until', 0) < time.time()):
+        db.session.info['use_replica'] = True
+
+@app.after_request
+def _pin_writers_to_primary(response):
+    # Whoever just wrote reads from the primary for a few seconds, so the page they are
+    # redirected to (e.g. the event after registering) cannot miss the write on a lagging replica.
+    if 'replica' in db.engines and (request.method not in ('GET', 'HEAD') or db.session.info.get('wrote')):
+        session['_primary_until'] = time.time() + app.config['REPLICA_PIN_SECONDS']
+    return response
+
+# Response compression. Levels are picked for dynamic pages, where compression runs on every
+# request: gzip 6 and brotli 4 cost well under a millisecond on a typical page (see
+# benchmarks/compression.py). Event streams are never compressed, as a compressor holds
+# back small writes until it has enough data, which would delay every event.
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/plain', 'text/css', 'text/csv', 'text/calendar', 'text/javascript',
+                          'application/javascript', 'application/json', 'image/svg+xml'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+def accepted_encoding():
+    """'br' or 'gzip' if the client accepts it (brotli preferred), else None."""
+    for encoding in ('br', 'gzip'):
+        if request.accept_encodings[encoding] and (encoding != 'br' or brotli):
+            return encoding
+    return None
+
+def compress_chunks(chunks, encoding='gzip'):
+    """Compress an iterable of str (as UTF-8) or bytes as it is consumed, without buffering the whole body."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+        compress, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            data = compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()  # e.g. stream_with_context's request context
+
+@app.after_request
+def compress_response(response):
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    if not min_size or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough  # send_file: handed to the server's file wrapper
+            or 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    encoding = accepted_encoding()
+    if not encoding:
+        return response
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    # Another representation of the same resource: a weak ETag still matches If-None-Match.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+class RequestMetrics:
+    """Per-route request latency, status and SQL counters for this process, summed over all workers on export.
+
+    Series are keyed by method and URL rule (`/event/<int:event_id>`), so there are only as
+    many as there are routes; requests that match no route count as `<unmatched>`.
+    Counters are written to `<directory>/<pid>-<token>.json` at most every `flush_every`
+    seconds and collect() adds up every worker's file. When a worker has exited, its file
+    is folded into `retired.json` and removed, so the totals never go backwards however
+    often workers are replaced. The directory must not be shared between hosts: whether
+    a worker has exited is judged by its pid.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+    RETIRED = 'retired.json'
+
+    def __init__(self, directory, flush_every=5.0):
+        self.directory = directory
+        self.flush_every = flush_every
+        self._series = {}
+        self._statuses = Counter()
+        self._slow_queries = Counter()
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        self._path_pid = self._path = None
+
+    def observe(self, method, route, status, seconds, queries, sql_seconds):
+        with self._lock:
+            series = self._series.get((method, route))
+            if series is None:
+                series = self._series[(method, route)] = {
+                    'latency': [0] * (len(self.LATENCY_BUCKETS) + 1), 'seconds': 0.0,
+                    'queries': [0] * (len(self.QUERY_BUCKETS) + 1), 'query_total': 0, 'sql_seconds': 0.0}
+            series['latency'][bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+            series['seconds'] += seconds
+            series['queries'][bisect.bisect_left(self.QUERY_BUCKETS, queries)] += 1
+            series['query_total'] += queries
+            series['sql_seconds'] += sql_seconds
+            self._statuses[(method, route, status)] += 1
+            flush = time.monotonic() - self._flushed_at >= self.flush_every
+        if flush:
+            self.flush()
+
+    def slow_query(self, route):
+        with self._lock:
+            self._slow_queries[route] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'series': [[method, route, dict(series, latency=list(series['latency']),
+                                                    queries=list(series['queries']))]
+                               for (method, route), series in self._series.items()],
+                    'statuses': [[*key, n] for key, n in self._statuses.items()],
+                    'slow_queries': [[route, n] for route, n in self._slow_queries.items()]}
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        if self._path_pid != os.getpid():
+            # The token keeps a later process that reuses this pid from overwriting our counts.
+            self._path_pid = os.getpid()
+            self._path = os.path.join(self.directory, f'{self._path_pid}-{uuid.uuid4().hex[:8]}.json')
+        path = self._path
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            app.logger.warning('Could not write request metrics to %s: %s', path, e)
+
+    @staticmethod
+    def _load(path):
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _worker_exited(name):
+        pid = name[:-len('.json')].partition('-')[0]  # <pid>-<token>.json, or <pid>.json from older releases
+        if not pid.isdigit():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # alive, but not ours to signal
+        return False
+
+    def retire_exited_workers(self, names):
+        """Fold the files of exited workers into RETIRED and delete them. Returns the names left.
+
+        Runs under an exclusive lock on `retired.lock`, so two processes collecting at
+        once neither fold a file twice nor lose each other's update of RETIRED.
+        """
+        exited = [name for name in names if self._worker_exited(name)]
+        if not exited:
+            return names
+        retired_path = os.path.join(self.directory, self.RETIRED)
+        with open(os.path.join(self.directory, 'retired.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                snapshots = [self._load(retired_path)]
+            except FileNotFoundError:
+                snapshots = []
+            folded = []
+            for name in exited:
+                path = os.path.join(self.directory, name)
+                try:
+                    snapshots.append(self._load(path))
+                except FileNotFoundError:
+                    continue  # folded by another process while we waited for the lock
+                except ValueError:
+                    pass  # cut short as its worker died; only the counts in it are lost
+                folded.append(path)
+            tmp = f'{retired_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.merge(snapshots), f)
+            os.replace(tmp, retired_path)
+            for path in folded:
+                os.remove(path)
+        return [name for name in names if name not in exited and name != self.RETIRED] + [self.RETIRED]
+
+    @staticmethod
+    def merge(snapshots):
+        """Several snapshots added together, as one snapshot."""
+        series, statuses, slow = {}, Counter(), Counter()
+        for snapshot in snapshots:
+            for method, route, values in snapshot['series']:
+                total = series.setdefault((method, route), values)
+                if total is not values:
+                    for name, value in values.items():
+                        total[name] = [a + b for a, b in zip(total[name], value)] if isinstance(value, list) \
+                            else total[name] + value
+            for method, route, status, n in snapshot['statuses']:
+                statuses[(method, route, status)] += n
+            for route, n in snapshot['slow_queries']:
+                slow[route] += n
+        return {'series': [[method, route, values] for (method, route), values in series.items()],
+                'statuses': [[*key, n] for key, n in statuses.items()],
+                'slow_queries': [[route, n] for route, n in slow.items()]}
+
+    def collect(self):
+        """Every worker's counters, current and retired, added together: (series, statuses, slow queries)."""
+        self.flush()
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith('.json')]
+        except OSError:
+            names = []
+        try:
+            names = self.retire_exited_workers(names)
+        except OSError as e:
+            app.logger.warning('Could not fold exited workers\' request metrics into %s: %s', self.RETIRED, e)
+        snapshots = []
+        for name in names:
+            try:
+                snapshots.append(self._load(os.path.join(self.directory, name)))
+            except (OSError, ValueError):
+                continue
+        if not snapshots:
+            snapshots = [self.snapshot()]
+        total = self.merge(snapshots)
+        return ({(method, route): values for method, route, values in total['series']},
+                Counter({(method, route, status): n for method, route, status, n in total['statuses']}),
+                Counter(dict(total['slow_queries'])))
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        series, statuses, slow = self.collect()
+
+        def labels(**values):
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values.values())
+            return '{' + ','.join(f'{k}="{v}"' for k, v in zip(values, escaped)) + '}'
+
+        def histogram(name, doc, bounds, counts_key, sum_key):
+            lines = [f'# HELP {name} {doc}', f'# TYPE {name} histogram']
+            for (method, route), values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip([*bounds, '+Inf'], values[counts_key]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{labels(method=method, route=route, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{labels(method=method, route=route)} {values[sum_key]}')
+                lines.append(f'{name}_count{labels(method=method, route=route)} {cumulative}')
+            return lines
+
+        lines = histogram('procur_request_duration_seconds', 'Time to produce a response, by route.',
+                          self.LATENCY_BUCKETS, 'latency', 'seconds')
+        lines += ['# HELP procur_requests_total Responses by route and status.', '# TYPE procur_requests_total counter']
+        lines += [f'procur_requests_total{labels(method=m, route=r, status=s)} {n}' for (m, r, s), n in sorted(statuses.items())]
+        lines += histogram('procur_request_sql_queries', 'SQL statements run per request, by route.',
+                           self.QUERY_BUCKETS, 'queries', 'query_total')
+        lines += ['# HELP procur_request_sql_seconds_total Time spent in SQL statements, by route.',
+                  '# TYPE procur_request_sql_seconds_total counter']
+        lines += [f'procur_request_sql_seconds_total{labels(method=m, route=r)} {v["sql_seconds"]}'
+                  for (m, r), v in sorted(series.items())]
+        lines += ['# HELP procur_slow_queries_total SQL statements slower than SLOW_QUERY_MS, by route.',
+                  '# TYPE procur_slow_queries_total counter']
+        lines += [f'procur_slow_queries_total{labels(route=r)} {n}' for r, n in sorted(slow.items())]
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics(app.config['METRICS_DIR'])
+
+def _metrics_route():
+    return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+@sa_event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+@sa_event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    in_request = has_request_context()
+    if in_request and 'metrics_started' in g:
+        g.sql_queries += 1
+        g.sql_seconds += elapsed
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        route = f'{request.method} {_metrics_route()}' if in_request else '(no request)'
+        app.logger.warning('Slow query (%.0f ms) in %s: %s', elapsed * 1000, route, ' '.join(statement.split())[:1000])
+        request_metrics.slow_query(_metrics_route() if in_request else '(no request)')
+
+def _start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+
+def _observe_request(response):
+    if 'metrics_started' in g:
+        request_metrics.observe(request.method, _metrics_route(), response.status_code,
+                                time.perf_counter() - g.metrics_started, g.sql_queries, g.sql_seconds)
+    return response
+
+# First in and last out, so the timings include every other hook (rate limiting, compression).
+app.before_request_funcs.setdefault(None, []).insert(0, _start_request_metrics)
+app.after_request_funcs.setdefault(None, []).insert(0, _observe_request)
+
+@app.before_request
+def _ensure_outbox_worker():
+    if app.config['OUTBOX_WORKER'] == 'thread':
+        start_outbox_thread()
 
 @app.context_processor
 def inject_nav_notifications():
     if current_user.is_authenticated:
-        unread = Notification.query.filter_by(user_id=current_user.id, read_at=None).order_by(Notification.created_at.desc()).limit(5).all()
-        count = Notification.query.filter_by(user_id=current_user.id, read_at=None).count()
-        return dict(nav_notifications=unread, nav_notifications_count=count)
+        nav = nav_notifications_cache.get(current_user.id)
+        if nav is None:
+            count = db.session.query(User.unread_notifications).filter_by(id=current_user.id).scalar() or 0
+            preview = []
+            if count:
+                preview = [
+                    {'id': n.id, 'title': n.title, 'body': n.body, 'created_at': n.created_at}
+                    for n in Notification.query.filter_by(user_id=current_user.id, read_at=None)
+                    .order_by(Notification.created_at.desc()).limit(5)
+                ]
+            nav = {'nav_notifications': preview, 'nav_notifications_count': count}
+            nav_notifications_cache.set(current_user.id, nav)
+        return nav
     return dict(nav_notifications=[], nav_notifications_count=0)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -315,7 +2207,7 @@ def register():
 
             token = uuid.uuid4().hex
             db.session.add(EmailVerificationToken(user_id=user.id, token=token))
-            db.session.add(Notification(user_id=user.id, title='Verify your email', body='Please verify your email to unlock full features.'))
+            notify(user.id, 'Verify your email', 'Please verify your email to unlock full features.')
             
 
             db.session.commit()
@@ -344,20 +2236,13 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user_events = EventRegistration.query.filter_by(user_id=current_user.id).all()
-    registered_events = []
-    
-    for reg in user_events:
-        if reg.status == 'confirmed':
-            event = Event.query.get(reg.event_id)
-            if event:
-                registered_events.append(event)
+    registered_events = Event.query.join(EventRegistration, EventRegistration.event_id == Event.id).filter(
+        EventRegistration.user_id == current_user.id,
+        EventRegistration.status == 'confirmed'
+    ).order_by(EventRegistration.id).all()
     
     if current_user.role in ['admin', 'coordinator']:
         created_events = Event.query.filter_by(created_by=current_user.id).all()
-
-        for event in created_events:
-            event.registration_count = EventRegistration.query.filter_by(event_id=event.id).count()
     else:
         created_events = []
     
@@ -371,24 +2256,17 @@ def events():
     status = request.args.get('status', '')
     search_query = request.args.get('q', '').strip()
     date_range = request.args.get('date_range', '')
-    sort_by = request.args.get('sort_by', 'date_asc')
+    sort_by = request.args.get('sort_by') or ('relevance' if search_query else 'date_asc')
     
     query = Event.query
+    rank = None
     
     if category:
         query = query.filter_by(category=category)
     if status:
         query = query.filter_by(status=status)
     if search_query:
-        like = f"%{search_query}%"
-        query = query.filter(
-            db.or_(
-                Event.title.ilike(like),
-                Event.description.ilike(like),
-                Event.location.ilike(like),
-                Event.category.ilike(like)
-            )
-        )
+        query, rank = search_events(query, search_query)
     if date_range:
         now_dt = datetime.now()
         if date_range == 'today':
@@ -407,49 +2285,102 @@ def events():
             query = query.filter(Event.event_date >= start, Event.event_date < end)
     
     if sort_by == 'date_desc':
-        query = query.order_by(Event.event_date.desc())
+        keys = [(Event.event_date, True), (Event.id, True)]
     elif sort_by == 'name_asc':
-        query = query.order_by(Event.title.asc())
+        keys = [(Event.title, False), (Event.id, False)]
     elif sort_by == 'popular':
-
-        subq = db.session.query(EventRegistration.event_id, db.func.count(EventRegistration.id).label('reg_count')).group_by(EventRegistration.event_id).subquery()
-        query = query.outerjoin(subq, Event.id == subq.c.event_id).order_by(db.desc(subq.c.reg_count.nullslast()))
+        keys = [(Event.registration_count, True), (Event.id, False)]
+    elif sort_by == 'relevance' and rank is not None:
+        keys = [(rank, False), (Event.event_date, False), (Event.id, False)]
     else:
-        query = query.order_by(Event.event_date.asc())
-
-    events = query.all()
-    
-
-    for event in events:
-        event.registration_count = EventRegistration.query.filter_by(event_id=event.id).count()
+        keys = [(Event.event_date, False), (Event.id, False)]
+
+    cursor = request.args.get('cursor')
+    total = None
+    if not cursor:
+        matches = query.order_by(None).with_entities(Event.id).limit(EVENTS_COUNT_CAP + 1).subquery()
+        total = db.session.query(db.func.count()).select_from(matches).scalar()
+    events, next_cursor = paginate_keyset(query, keys, cursor, per_page=EVENTS_PER_PAGE)
+    args = {k: v for k, v in request.args.items() if k != 'format'}
+    next_url = url_for('events', **{**args, 'cursor': next_cursor}) if next_cursor else None
+    posters = event_posters([event.id for event in events])
+
+    if request.args.get('format') == 'json':
+        grid_card = get_template_attribute('_event_cards.html', 'grid_card')
+        list_card = get_template_attribute('_event_cards.html', 'list_card')
+        return jsonify({
+            'grid': ''.join(grid_card(event, posters.get(event.id)) for event in events),
+            'list': ''.join(list_card(event) for event in events),
+            'count': len(events),
+            'next_url': next_url,
+        })
     
     categories = [c[0] for c in db.session.query(Event.category).distinct().all()]
-    print(type(events))  # Should print <class 'list'>
-    print(type(categories))  # Should print <class 'list'>
-    
-    return render_template('events.html', events=events, categories=categories, category=category, status=status)
+
+    return render_template('events.html', events=events, categories=categories, category=category, status=status,
+                           total=total, total_cap=EVENTS_COUNT_CAP, next_url=next_url, posters=posters)
+
+@app.route('/api/events/search')
+@limiter.limit("120 per minute")
+def search_events_api():
+    q = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 8, type=int), 50)
+    if not q:
+        return jsonify({'query': q, 'results': []})
+    query, rank = search_events(Event.query, q)
+    query = query.order_by(rank, Event.event_date) if rank is not None else query.order_by(Event.event_date)
+    results = [{
+        'id': e.id,
+        'title': e.title,
+        'category': e.category,
+        'location': e.location,
+        'status': e.status,
+        'event_date': e.event_date.isoformat(),
+        'registration_count': e.registration_count,
+        'max_participants': e.max_participants,
+        'url': url_for('event_detail', event_id=e.id),
+    } for e in query.limit(limit)]
+    return jsonify({'query': q, 'results': results})
 
 @app.route('/event/<int:event_id>')
 def event_detail(event_id):
     event = Event.query.get_or_404(event_id)
-    registrations = EventRegistration.query.filter_by(event_id=event_id).all()
+    registrations, participants_cursor = paginate_keyset(
+        EventRegistration.query.filter_by(event_id=event_id).options(db.joinedload(EventRegistration.user)),
+        [(EventRegistration.id, False)],
+        request.args.get('participants_cursor'), per_page=ROWS_PER_PAGE
+    )
     schedule = Schedule.query.filter_by(event_id=event_id).order_by(Schedule.start_time).all()
-    comments = Comment.query.filter_by(event_id=event_id).order_by(Comment.created_at.desc()).all()
+    attachments = EventAttachment.query.filter_by(event_id=event_id).order_by(EventAttachment.id).all()
+    comments, comments_cursor = paginate_keyset(
+        Comment.query.filter_by(event_id=event_id).options(db.joinedload(Comment.user)),
+        [(Comment.created_at, True), (Comment.id, True)],
+        request.args.get('comments_cursor'), per_page=ROWS_PER_PAGE
+    )
     
     is_registered = False
+    can_manage = False
+    registration = None
     if current_user.is_authenticated:
-        registration = EventRegistration.query.filter_by(
-            event_id=event_id, 
-            user_id=current_user.id
+        registration = EventRegistration.query.filter(
+            EventRegistration.event_id == event_id,
+            EventRegistration.user_id == current_user.id,
+            EventRegistration.status != 'cancelled'
         ).first()
         is_registered = registration is not None
+        can_manage = user_can_manage_event(current_user, event)
     
     return render_template('event_detail.html', 
                          event=event, 
                          registrations=registrations,
+                         my_registration=registration,
                          schedule=schedule,
+                         attachments=attachments,
                          comments=comments,
                          is_registered=is_registered,
+                         can_manage=can_manage,
+                         more_participants_url=url_for('event_detail', event_id=event_id, participants_cursor=participants_cursor) if participants_cursor else None,
+                         more_comments_url=url_for('event_detail', event_id=event_id, comments_cursor=comments_cursor, _anchor='discussion') if comments_cursor else None,
                          now=datetime.now())
 
 @app.route('/event/<int:event_id>/register', methods=['POST'])
@@ -458,64 +2389,38 @@ def register_event(event_id):
     event = Event.query.get_or_404(event_id)
     
 
-    existing_registration = EventRegistration.query.filter_by(
-        event_id=event_id, 
-        user_id=current_user.id
-    ).first()
-    
-    if existing_registration:
-        flash('You are already registered for this event', 'info')
-        return redirect(url_for('event_detail', event_id=event_id))
-    
-
     if datetime.now() > event.registration_deadline:
         flash('Registration deadline has passed', 'error')
         return redirect(url_for('event_detail', event_id=event_id))
     
 
-    current_registrations = EventRegistration.query.filter_by(event_id=event_id).count()
-    if current_registrations >= event.max_participants:
-
-        existing_wait = Waitlist.query.filter_by(event_id=event_id, user_id=current_user.id).first()
-        if not existing_wait:
-            position = (db.session.query(db.func.max(Waitlist.position)).filter_by(event_id=event_id).scalar() or 0) + 1
-            db.session.add(Waitlist(event_id=event_id, user_id=current_user.id, position=position))
-            db.session.commit()
-            flash('Event is full. You have been added to the waitlist.', 'info')
-        else:
-            flash('Event is full and you are already on the waitlist.', 'info')
+    outcome, registration = register_for_event(event, current_user.id)
+    if outcome == 'already_registered':
+        flash('You are already registered for this event', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    if outcome == 'already_waitlisted':
+        flash('Event is full and you are already on the waitlist.', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    if outcome == 'waitlisted':
+        db.session.commit()
+        flash('Event is full. You have been added to the waitlist.', 'info')
         return redirect(url_for('event_detail', event_id=event_id))
-    
-
-    qr_token = str(uuid.uuid4())
 
-    notes_value = f"qr:{qr_token}"
-    registration = EventRegistration(
-        event_id=event_id,
-        user_id=current_user.id,
-        notes=notes_value
+    enqueue_fanout(
+        f'register_event:{registration.id}:{registration.registration_date.isoformat()}',
+        'New Event Registration', f'{current_user.username} registered for {event.title}', event_id=event.id,
+        audit={'actor_id': current_user.id, 'action': 'register_event', 'object_type': 'event',
+               'object_id': event.id, 'snapshot': f'user={current_user.id}'}
     )
-    db.session.add(registration)
-    db.session.commit()
-
-
-    if event.require_approval:
-        registration.status = 'registered'
-    else:
-        registration.status = 'confirmed'
-
-    recipients = [event.created_by]
-    for ec in EventCoordinator.query.filter_by(event_id=event.id).all():
-        recipients.append(ec.user_id)
-    for rid in set(recipients):
-        db.session.add(Notification(user_id=rid, title='New Event Registration', body=f'{current_user.username} registered for {event.title}'))
-    db.session.add(AuditLog(actor_id=current_user.id, action='register_event', object_type='event', object_id=event.id, snapshot=f'user={current_user.id}'))
     db.session.commit()
+    if app.config['QR_PRERENDER']:
+        prerender_qr([registration.ticket.code])
     
     flash('Successfully registered for the event!', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
 @app.route('/event/<int:event_id>/toggle_approval')
+@use_primary
 @login_required
 def toggle_event_approval(event_id):
     event = Event.query.get_or_404(event_id)
@@ -527,6 +2432,162 @@ def toggle_event_approval(event_id):
     flash(f'Registration approval requirement set to {event.require_approval}', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
+def attachment_blob_path(sha256):
+    return os.path.join(app.config['UPLOAD_DIR'], 'blobs', sha256[:2], sha256)
+
+class BlobUpload:
+    """Where an attachment is written while the multipart body is parsed (see AppRequest).
+
+    Chunks go straight to a temporary file next to the content-addressed store and
+    are hashed as they arrive, so the body is read once, memory use does not depend
+    on the file size, and a file over max_bytes is cut off (413) at the first chunk
+    past the limit. store() renames the file into place; an upload that is never
+    stored is deleted when the request closes its files.
+    """
+
+    def __init__(self, max_bytes):
+        directory = os.path.join(app.config['UPLOAD_DIR'], 'blobs')
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'.{uuid.uuid4().hex}.part')
+        self.file = open(self.path, 'w+b')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            self.close()  # the parser drops this stream without closing it
+            raise RequestEntityTooLarge()
+        self.digest.update(chunk)
+        return self.file.write(chunk)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def store(self):
+        """Move the upload into the store under its hash (dropping it if that content is there); return (sha256, size)."""
+        self.file.close()
+        sha256 = self.digest.hexdigest()
+        path = attachment_blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(self.path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.path, path)  # atomic, and identical content either way if two uploads race
+        self.path = None
+        return sha256, self.size
+
+    def close(self):
+        self.file.close()
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+
+class AppRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Attachments skip Werkzeug's spooled temporary file and are written into the store as they arrive.
+        if self.endpoint == 'upload_event_file':
+            return BlobUpload(app.config['MAX_UPLOAD_MB'] * 1024 * 1024)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = AppRequest
+
+def guess_content_type(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+def is_previewable(content_type):
+    """Raster images, which get thumbnails and open inline; SVG is excluded as it can carry scripts."""
+    return bool(content_type) and content_type.startswith('image/') and content_type != 'image/svg+xml'
+
+# Thumbnails are stored next to their original as <blob>.w<width>.<ext>, so like the blob
+# itself they are named by content and never need invalidating.
+THUMBNAIL_WIDTHS = (160, 480, 960)
+THUMBNAIL_FORMATS = {'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+                     'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+app.jinja_env.globals['thumbnail_widths'] = THUMBNAIL_WIDTHS
+app.jinja_env.tests['previewable'] = is_previewable
+
+def thumbnail_path(blob_path, width, ext):
+    return f'{blob_path}.w{width}.{ext}'
+
+def render_thumbnails(blob_path):
+    """Write every thumbnail width and format for the image at `blob_path`; return how many were written.
+
+    Runs in the shared process pool after an upload, or in the request for a
+    thumbnail that is missing. JPEGs are decoded at a reduced scale where libjpeg
+    can (draft), and each width is resized from the next larger one rather than
+    from the full-size original. Files that are not images write nothing.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        with Image.open(blob_path) as original:
+            original.draft('RGB', (max(THUMBNAIL_WIDTHS), max(THUMBNAIL_WIDTHS)))
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return 0
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    written = 0
+    for width in sorted(THUMBNAIL_WIDTHS, reverse=True):
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for ext, (fmt, _, options) in THUMBNAIL_FORMATS.items():
+            frame = image
+            if fmt == 'JPEG' and image.mode == 'RGBA':
+                frame = Image.new('RGB', image.size, 'white')
+                frame.paste(image, mask=image.getchannel('A'))
+            path = thumbnail_path(blob_path, width, ext)
+            tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+            frame.save(tmp, fmt, **options)
+            os.replace(tmp, path)  # atomic, so a concurrent reader never sees half a file
+            written += 1
+    return written
+
+def queue_thumbnails(blob_path):
+    """Render an image's thumbnails in the background, unless an identical upload already has them."""
+    if all(os.path.exists(thumbnail_path(blob_path, w, ext)) for w in THUMBNAIL_WIDTHS for ext in THUMBNAIL_FORMATS):
+        return
+    future = process_pool().submit(render_thumbnails, blob_path)
+    future.add_done_callback(functools.partial(_log_thumbnail_failure, blob_path))
+
+def _log_thumbnail_failure(blob_path, future):
+    # Nobody waits on the future, so without this a failed render (a corrupt image, a
+    # crashed pool process) would go unnoticed; the page just keeps showing the original.
+    if not future.cancelled() and future.exception() is not None:
+        app.logger.error('Rendering thumbnails for %s failed', blob_path, exc_info=future.exception())
+
+def send_upload(path, mimetype, download_name=None, inline=True, etag=True, max_age=86400):
+    """Send a file under UPLOAD_DIR: through X-Accel-Redirect when configured, else send_file.
+
+    send_file answers If-None-Match and Range requests itself and hands the open file
+    to the WSGI server's file wrapper (or to the front server with USE_X_SENDFILE),
+    so the body is never read into the worker.
+    """
+    accel = app.config['UPLOAD_ACCEL_REDIRECT']
+    if accel:
+        response = Response(mimetype=mimetype)
+        relative = os.path.relpath(path, app.config['UPLOAD_DIR']).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = accel.rstrip('/') + '/' + urllib.parse.quote(relative)
+        if download_name:
+            response.headers['Content-Disposition'] = content_disposition('inline' if inline else 'attachment', download_name)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=not inline, download_name=download_name,
+                             etag=etag, conditional=True, max_age=max_age)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+def content_disposition(kind, filename):
+    """`kind; filename=...` with an RFC 5987 `filename*` for names that are not plain ASCII."""
+    simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode().replace('"', '')
+    if simple == filename:
+        return f'{kind}; filename="{simple}"'
+    return f"{kind}; filename=\"{simple}\"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+
 @app.route('/event/<int:event_id>/upload', methods=['POST'])
 @login_required
 def upload_event_file(event_id):
@@ -534,19 +2595,74 @@ def upload_event_file(event_id):
     if not user_can_manage_event(current_user, event):
         flash('Access denied', 'error')
         return redirect(url_for('event_detail', event_id=event_id))
-    f = request.files.get('file')
+    too_large = f"Attachments can be at most {app.config['MAX_UPLOAD_MB']} MB"
+    try:
+        f = request.files.get('file')
+    except RequestEntityTooLarge:
+        flash(too_large, 'error')
+        return redirect(url_for('event_detail', event_id=event_id))
     if not f or not f.filename:
         flash('No file selected', 'error')
         return redirect(url_for('event_detail', event_id=event_id))
-    os.makedirs('uploads', exist_ok=True)
-    safe_name = f"{event_id}_{int(datetime.utcnow().timestamp())}_{f.filename}"
-    path = os.path.join('uploads', safe_name)
-    f.save(path)
-    db.session.add(EventAttachment(event_id=event_id, filename=safe_name))
+    sha256, size = f.stream.store()
+    filename = os.path.basename(f.filename.replace('\\', '/'))[:255] or 'attachment'
+    if EventAttachment.query.filter_by(event_id=event_id, sha256=sha256, filename=filename).first():
+        flash('That file is already attached', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    content_type = guess_content_type(filename)
+    db.session.add(EventAttachment(event_id=event_id, filename=filename, sha256=sha256, size=size,
+                                   content_type=content_type))
     db.session.commit()
+    if is_previewable(content_type):
+        queue_thumbnails(attachment_blob_path(sha256))
     flash('File uploaded', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
+@app.route('/event/<int:event_id>/attachment/<int:attachment_id>')
+def event_attachment(event_id, attachment_id):
+    """Serve an attachment from disk, or have the front server send it (X-Sendfile / X-Accel-Redirect)."""
+    attachment = EventAttachment.query.filter_by(id=attachment_id, event_id=event_id).first_or_404()
+    if attachment.sha256:
+        path = attachment_blob_path(attachment.sha256)
+    else:
+        # Pre-blob uploads were saved under their own name, which was never sanitised.
+        path = safe_join(app.config['UPLOAD_DIR'], attachment.filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = attachment.content_type or guess_content_type(attachment.filename)
+    # Uploaded HTML or SVG must never render on our origin; only images and PDFs open inline.
+    inline = mimetype == 'application/pdf' or is_previewable(mimetype)
+    return send_upload(path, mimetype, attachment.filename, inline=inline, etag=attachment.sha256 or True)
+
+@app.route('/event/<int:event_id>/attachment/<int:attachment_id>/w<int:width>.<ext>')
+def attachment_thumbnail(event_id, attachment_id, width, ext):
+    """A resized copy of an image attachment; the URL never changes content, so it is cached for a year."""
+    if width not in THUMBNAIL_WIDTHS or ext not in THUMBNAIL_FORMATS:
+        abort(404)
+    attachment = EventAttachment.query.filter_by(id=attachment_id, event_id=event_id).first_or_404()
+    if not attachment.sha256 or not is_previewable(attachment.content_type):
+        abort(404)
+    blob = attachment_blob_path(attachment.sha256)
+    path = thumbnail_path(blob, width, ext)
+    if not os.path.isfile(path):
+        # Not rendered yet (the upload was moments ago, or predates thumbnails): render it here, once.
+        if not os.path.isfile(blob) or not render_thumbnails(blob):
+            abort(404)
+    response = send_upload(path, THUMBNAIL_FORMATS[ext][1], etag=f'{attachment.sha256}.w{width}.{ext}',
+                           max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
+def event_posters(event_ids):
+    """The first image attachment of each event, shown as its thumbnail in listings: {event_id: attachment}."""
+    if not event_ids:
+        return {}
+    first = db.select(db.func.min(EventAttachment.id)).where(
+        EventAttachment.event_id.in_(event_ids), EventAttachment.sha256.isnot(None),
+        EventAttachment.content_type.like('image/%'), EventAttachment.content_type != 'image/svg+xml'
+    ).group_by(EventAttachment.event_id)
+    return {a.event_id: a for a in EventAttachment.query.filter(EventAttachment.id.in_(first))}
+
 @app.route('/event/<int:event_id>/comment', methods=['POST'])
 @login_required
 def add_comment(event_id):
@@ -557,129 +2673,909 @@ def add_comment(event_id):
         return redirect(url_for('event_detail', event_id=event_id))
     comment = Comment(event_id=event.id, user_id=current_user.id, body=body)
     db.session.add(comment)
+    db.session.flush()
 
-    event_creator_id = event.created_by
-    if event_creator_id != current_user.id:
-        db.session.add(Notification(user_id=event_creator_id, title='New Comment', body=f'{current_user.username} commented on {event.title}'))
-    for ec in EventCoordinator.query.filter_by(event_id=event.id).all():
-        if ec.user_id != current_user.id and ec.user_id != event_creator_id:
-            db.session.add(Notification(user_id=ec.user_id, title='New Comment', body=f'{current_user.username} commented on {event.title}'))
-    db.session.add(AuditLog(actor_id=current_user.id, action='add_comment', object_type='event', object_id=event.id))
+    enqueue_fanout(
+        f'add_comment:{comment.id}', 'New Comment', f'{current_user.username} commented on {event.title}',
+        event_id=event.id, exclude=[current_user.id],
+        audit={'actor_id': current_user.id, 'action': 'add_comment', 'object_type': 'event', 'object_id': event.id}
+    )
     db.session.commit()
     flash('Comment posted', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
+calendar_cache = TTLCache('calendar_feeds', maxsize=2000, ttl=3600)
+CALENDAR_PAST_DAYS = 30
+
+def ics_escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+def render_ics(rows, name):
+    """Render (id, title, description, event_date, location, status, updated_at) rows as an iCalendar feed."""
+    host = request.host.split(':')[0]
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Procur//EN', 'CALSCALE:GREGORIAN',
+             f'X-WR-CALNAME:{ics_escape(name)}']
+    for event_id, title, description, event_date, location, status, updated_at in rows:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:event-{event_id}@{host}',
+            f'DTSTAMP:{(updated_at or event_date).strftime("%Y%m%dT%H%M%SZ")}',
+            f'SUMMARY:{ics_escape(title)}',
+            f'DTSTART:{event_date.strftime("%Y%m%dT%H%M%S")}',
+            f'DTEND:{(event_date + timedelta(hours=2)).strftime("%Y%m%dT%H%M%S")}',
+            f'LOCATION:{ics_escape(location)}',
+            f'DESCRIPTION:{ics_escape(description)}',
+        ]
+        if status == 'cancelled':
+            lines.append('STATUS:CANCELLED')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    # RFC 5545 content lines are at most 75 characters; longer ones continue on lines starting with a space.
+    folded = []
+    for line in lines:
+        while len(line) > 75:
+            folded.append(line[:75])
+            line = ' ' + line[75:]
+        folded.append(line)
+    return '\r\n'.join(folded) + '\r\n'
+
+_ICS_COLUMNS = (Event.id, Event.title, Event.description, Event.event_date, Event.location, Event.status, Event.updated_at)
+
+def calendar_response(scope, fingerprint, last_modified, build, filename, public):
+    """Serve a feed with ETag/Last-Modified, answering 304 or from calendar_cache when possible.
+
+    `fingerprint` is a cheap aggregate over everything the feed shows, so any change
+    to it yields a new ETag and a new cache key; stale copies are never served.
+    The host is part of both too, as the event UIDs name it. `build` runs the
+    full query and renders the feed only on a cache miss.
+    """
+    etag = hashlib.sha1(f'{scope}|{request.host}|{fingerprint}'.encode()).hexdigest()
+    response = Response(mimetype='text/calendar')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.max_age = 300
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+    body = calendar_cache.get((scope, etag))
+    if body is None:
+        body = build()
+        calendar_cache.set((scope, etag), body)
+    response.set_data(body)
+    response.headers['Content-Disposition'] = f'inline; filename={filename}'
+    return response
+
+def _user_feed(user):
+    active = db.and_(EventRegistration.user_id == user.id, EventRegistration.status != 'cancelled')
+    fingerprint = db.session.query(
+        db.func.count(EventRegistration.id), db.func.coalesce(db.func.sum(EventRegistration.id), 0),
+        db.func.max(EventRegistration.registration_date), db.func.max(Event.updated_at)
+    ).join(Event, Event.id == EventRegistration.event_id).filter(active).one()
+    last_modified = max([d for d in fingerprint[2:] if d], default=None)
+
+    def build():
+        rows = db.session.query(*_ICS_COLUMNS).join(
+            EventRegistration, EventRegistration.event_id == Event.id
+        ).filter(active).order_by(Event.event_date).all()
+        return render_ics(rows, f'{user.username} - Procur')
+    return calendar_response(f'user:{user.id}', fingerprint, last_modified, build, 'my_calendar.ics', public=False)
+
 @app.route('/event/<int:event_id>/calendar.ics')
 def event_ics(event_id):
-    event = Event.query.get_or_404(event_id)
-    ics = []
-    ics.append('BEGIN:VCALENDAR')
-    ics.append('VERSION:2.0')
-    ics.append('PRODID:-//Procur//EN')
-    ics.append('BEGIN:VEVENT')
-    ics.append(f'SUMMARY:{event.title}')
-    ics.append(f'DTSTART:{event.event_date.strftime("%Y%m%dT%H%M%S")}')
-
-    end_dt = event.event_date + timedelta(hours=2)
-    ics.append(f'DTEND:{end_dt.strftime("%Y%m%dT%H%M%S")}')
-    ics.append(f'LOCATION:{event.location}')
-    ics.append(f'DESCRIPTION:{event.description.replace("\n", " ")}')
-    ics.append('END:VEVENT')
-    ics.append('END:VCALENDAR')
-    ics_content = "\r\n".join(ics)
-    return Response(ics_content, mimetype='text/calendar', headers={'Content-Disposition': f'attachment; filename=event_{event.id}.ics'})
+    row = db.session.query(*_ICS_COLUMNS).filter(Event.id == event_id).first_or_404()
+    response = calendar_response(f'event:{event_id}', row[-1], row[-1], lambda: render_ics([row], row[1]),
+                                 f'event_{event_id}.ics', public=True)
+    response.headers['Content-Disposition'] = f'attachment; filename=event_{event_id}.ics'
+    return response
 
 @app.route('/calendar/feed.ics')
 @login_required
 def user_calendar_feed():
-    regs = EventRegistration.query.filter_by(user_id=current_user.id).all()
-    ics_lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Procur//EN']
-    for reg in regs:
-        event = Event.query.get(reg.event_id)
-        if not event:
-            continue
-        ics_lines.append('BEGIN:VEVENT')
-        ics_lines.append(f'SUMMARY:{event.title}')
-        ics_lines.append(f'DTSTART:{event.event_date.strftime("%Y%m%dT%H%M%S")}')
-        end_dt = event.event_date + timedelta(hours=2)
-        ics_lines.append(f'DTEND:{end_dt.strftime("%Y%m%dT%H%M%S")}')
-        ics_lines.append(f'LOCATION:{event.location}')
-        ics_lines.append(f'DESCRIPTION:{event.description.replace("\n", " ")}')
-        ics_lines.append('END:VEVENT')
-    ics_lines.append('END:VCALENDAR')
-    return Response("\r\n".join(ics_lines), mimetype='text/calendar', headers={'Content-Disposition': 'attachment; filename=my_calendar.ics'})
+    return _user_feed(current_user)
+
+@app.route('/calendar/<string:token>.ics')
+@limiter.limit("120 per hour")
+def calendar_subscription_feed(token):
+    """The same feed as /calendar/feed.ics, authorised by the user's calendar token instead of a session."""
+    user = User.query.filter_by(calendar_token=token).first_or_404()
+    return _user_feed(user)
+
+@app.route('/calendar/events.ics')
+@limiter.limit("120 per hour")
+def public_calendar_feed():
+    """Every upcoming or ongoing event (and those from the last month), for anyone to subscribe to."""
+    # event_date is naive local time, so the cutoff is too.
+    visible = Event.event_date >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=CALENDAR_PAST_DAYS)
+    fingerprint = db.session.query(
+        db.func.count(Event.id), db.func.coalesce(db.func.sum(Event.id), 0), db.func.max(Event.updated_at)
+    ).filter(visible).one()
+
+    def build():
+        return render_ics(db.session.query(*_ICS_COLUMNS).filter(visible).order_by(Event.event_date).all(),
+                          'Procur events')
+    return calendar_response('public', fingerprint, fingerprint[2], build, 'events.ics', public=True)
+
+@app.route('/calendar/token', methods=['POST'])
+@login_required
+def rotate_calendar_token():
+    """Create (or replace, invalidating the old link) the user's calendar subscription token."""
+    user = db.session.get(User, current_user.id)
+    had_token = user.calendar_token is not None
+    user.calendar_token = uuid.uuid4().hex
+    db.session.add(AuditLog(actor_id=user.id, action='rotate_calendar_token', object_type='user', object_id=user.id))
+    db.session.commit()
+    flash('Calendar link reset; update your calendar app.' if had_token else 'Calendar link created', 'success')
+    return redirect(url_for('dashboard'))
+
+class QRImageCache:
+    """Rendered ticket QR PNGs, cached in memory (LRU) and on disk, addressed by a hash of their content.
+
+    A QR image depends only on the ticket code, so the SHA-256 of the code names the
+    file, doubles as the HTTP ETag and never needs invalidating. The disk cache is
+    trimmed back to `max_files` (oldest first) whenever it grows 10% past it.
+    """
+
+    def __init__(self, directory, max_files, memory_items=2048):
+        self.directory = directory
+        self.max_files = max_files
+        self.memory = TTLCache('qr_images_memory', maxsize=memory_items, ttl=86400)
+        self.disk_hits = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+        self._writes = 0
+        self._lock = threading.Lock()
+        CACHES['qr_images'] = self
+
+    @staticmethod
+    def key(code):
+        return hashlib.sha256(code.encode()).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.png')
+
+    def get(self, code):
+        """Return (key, png bytes) for a ticket code, rendering it on a miss."""
+        key = self.key(code)
+        png = self.memory.get(key)
+        if png is not None:
+            return key, png
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            with self._lock:
+                self.disk_hits += 1
+        except OSError:
+            png = self._render(code)
+            self._store(path, png)
+        self.memory.set(key, png)
+        return key, png
+
+    def _render(self, code):
+        import qrcode
+        started = time.perf_counter()
+        buf = io.BytesIO()
+        qrcode.make(f'CHECKIN:{code}').save(buf, format='PNG')
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - started
+        return buf.getvalue()
+
+    def _store(self, path, png):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, path)  # atomic, so a concurrent reader never sees half a file
+        with self._lock:
+            self._writes += 1
+            check = self._writes % max(self.max_files // 10, 1) == 0
+        if check:
+            self.trim()
+
+    def trim(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            files.extend(os.path.join(root, n) for n in names if n.endswith('.png'))
+        if len(files) <= self.max_files:
+            return 0
+        files.sort(key=lambda p: os.stat(p).st_mtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(files) - self.max_files
+
+    def stats(self):
+        memory = self.memory.stats()
+        with self._lock:
+            lookups = memory['hits'] + memory['misses']
+            hits = memory['hits'] + self.disk_hits
+            return {'memory_size': memory['size'], 'memory_hits': memory['hits'], 'disk_hits': self.disk_hits,
+                    'renders': self.renders, 'hit_rate': round(hits / lookups, 4) if lookups else None,
+                    'avg_render_ms': round(self.render_seconds / self.renders * 1000, 2) if self.renders else None}
+
+
+qr_cache = QRImageCache(app.config['QR_CACHE_DIR'], app.config['QR_CACHE_MAX_FILES'])
+_qr_prerender_pool = None
+
+def prerender_qr(codes):
+    """Render ticket QR codes into the cache in the background so the first view is a hit."""
+    global _qr_prerender_pool
+    if _qr_prerender_pool is None:
+        _qr_prerender_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-prerender')
+    for code in codes:
+        _qr_prerender_pool.submit(qr_cache.get, code)
+
+# Printable ticket sheets: A4 at 150 dpi, 2 x 4 badges per page.
+SHEET_SIZE_PX = (1240, 1754)
+SHEET_SIZE_PT = (595, 842)
+BADGE_SIZE_PX = (620, 438)
+BADGES_PER_PAGE = 8
+BADGE_BATCH = 50
+
+@functools.lru_cache(maxsize=None)
+def _badge_font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow built without FreeType
+        return ImageFont.load_default()
+
+def _fit(draw, text, font, width):
+    text = text or ''
+    while text and draw.textlength(text, font=font) > width:
+        text = text[:-2] + '…' if len(text) > 1 else ''
+    return text
+
+def draw_badge(ticket, event_title, event_date):
+    """Render one badge (QR code, name, school, event) as a PIL image. `ticket` is (code, name, school)."""
+    from PIL import Image, ImageDraw
+    code, name, school = ticket
+    width, height = BADGE_SIZE_PX
+    # Greyscale: a third of the pixels to draw and encode, and tickets are printed in black anyway.
+    badge = Image.new('L', BADGE_SIZE_PX, 255)
+    draw = ImageDraw.Draw(badge)
+    draw.rectangle([6, 6, width - 7, height - 7], outline=180, width=2)
+    qr = Image.open(io.BytesIO(qr_cache.get(code)[1])).convert('L').resize((280, 280), Image.NEAREST)
+    badge.paste(qr, (20, (height - 280) // 2))
+    text_x, text_width = 320, width - 340
+    draw.text((text_x, 60), _fit(draw, event_title, _badge_font(22), text_width), fill=90, font=_badge_font(22))
+    draw.text((text_x, 100), _fit(draw, event_date, _badge_font(18), text_width), fill=90, font=_badge_font(18))
+    draw.text((text_x, 180), _fit(draw, name, _badge_font(36), text_width), fill=0, font=_badge_font(36))
+    draw.text((text_x, 235), _fit(draw, school, _badge_font(22), text_width), fill=40, font=_badge_font(22))
+    draw.text((text_x, height - 60), _fit(draw, code.partition('.')[0], _badge_font(14), text_width), fill=120, font=_badge_font(14))
+    return badge
+
+def render_ticket_sheet(tickets, event_title, event_date):
+    """One printable page of up to BADGES_PER_PAGE badges, as (JPEG bytes, pixel size). Runs in a worker process."""
+    from PIL import Image
+    page = Image.new('L', SHEET_SIZE_PX, 255)
+    for i, ticket in enumerate(tickets):
+        page.paste(draw_badge(ticket, event_title, event_date), ((i % 2) * BADGE_SIZE_PX[0], (i // 2) * BADGE_SIZE_PX[1]))
+    buf = io.BytesIO()
+    page.save(buf, format='JPEG', quality=85)
+    return buf.getvalue(), page.size
+
+def render_ticket_badges(tickets, event_title, event_date):
+    """[(filename, PNG bytes)] for a batch of badges. Runs in a worker process."""
+    rendered = []
+    for ticket in tickets:
+        buf = io.BytesIO()
+        draw_badge(ticket, event_title, event_date).save(buf, format='PNG', compress_level=1)
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', ticket[1]) or 'ticket'
+        rendered.append((f'{name}_{ticket[0].partition(".")[0][:8]}.png', buf.getvalue()))
+    return rendered
+
+def parallel_map(fn, batches, *args):
+    """Yield fn(batch, *args) in order, from process_pool() with a bounded number of batches in flight."""
+    workers = min(app.config['PROCESS_POOL_WORKERS'], len(batches))
+    if workers <= 1:
+        for batch in batches:
+            yield fn(batch, *args)
+        return
+    pool = process_pool()
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.submit(fn, batch, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:  # the download was abandoned: don't render the rest
+            future.cancel()
+
+def iter_pdf(pages):
+    """Stream a PDF whose pages are full-page greyscale JPEGs from `pages` ((bytes, (w, h)) pairs).
+
+    Objects are written as soon as each page arrives; only their byte offsets are kept
+    for the cross-reference table at the end. Object 2 (the page tree) is written last
+    and referenced ahead of time, which PDF readers allow.
+    """
+    offsets = {}
+    position = 0
+    kids = []
+
+    def obj(number, body, stream=None):
+        nonlocal position
+        offsets[number] = position
+        data = f'{number} 0 obj\n{body}\n'.encode()
+        if stream is not None:
+            data += b'stream\n' + stream + b'\nendstream\n'
+        data += b'endobj\n'
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+    yield obj(1, '<< /Type /Catalog /Pages 2 0 R >>')
+    page_w, page_h = SHEET_SIZE_PT
+    number = 3
+    for jpeg, (width, height) in pages:
+        image, content, page = number, number + 1, number + 2
+        number += 3
+        draw = f'q {page_w} 0 0 {page_h} 0 0 cm /Im0 Do Q'.encode()
+        yield obj(image, f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray '
+                         f'/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>', jpeg)
+        yield obj(content, f'<< /Length {len(draw)} >>', draw)
+        yield obj(page, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w} {page_h}] '
+                        f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>')
+        kids.append(f'{page} 0 R')
+    yield obj(2, f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>')
+    xref = [f'xref\n0 {number}\n', '0000000000 65535 f \n']
+    xref += [f'{offsets[n]:010d} 00000 n \n' for n in range(1, number)]
+    xref.append(f'trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n')
+    yield ''.join(xref).encode()
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that lets zipfile stream: it reports a position but cannot seek."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def iter_zip(files):
+    """Stream a ZIP of (name, bytes) pairs; PNGs are already compressed, so entries are stored."""
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+@app.route('/event/<int:event_id>/tickets.<string:fmt>')
+@login_required
+def export_event_tickets(event_id, fmt):
+    """Every active ticket for an event, as a printable PDF (8 badges per A4 page) or a ZIP of badge PNGs."""
+    event = Event.query.get_or_404(event_id)
+    if not user_can_manage_event(current_user, event):
+        flash('Access denied', 'error')
+        return redirect(url_for('event_detail', event_id=event_id))
+    if fmt not in ('pdf', 'zip'):
+        abort(404)
+    tickets = [(ticket_code(token), username, school) for token, username, school in db.session.query(
+        Ticket.token, User.username, User.school
+    ).join(EventRegistration, Ticket.registration_id == EventRegistration.id).join(
+        User, User.id == EventRegistration.user_id
+    ).filter(EventRegistration.event_id == event_id, EventRegistration.status != 'cancelled').order_by(User.username)]
+    if not tickets:
+        flash('No tickets to print yet', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    title, date = event.title, event.event_date.strftime('%b %d, %Y %I:%M %p')
+    filename = f'event_{event_id}_tickets.{fmt}'
+
+    if fmt == 'pdf':
+        pages = [tickets[i:i + BADGES_PER_PAGE] for i in range(0, len(tickets), BADGES_PER_PAGE)]
+        body = iter_pdf(parallel_map(render_ticket_sheet, pages, title, date))
+        mimetype = 'application/pdf'
+    else:
+        batches = [tickets[i:i + BADGE_BATCH] for i in range(0, len(tickets), BADGE_BATCH)]
+        body = iter_zip(f for batch in parallel_map(render_ticket_badges, batches, title, date) for f in batch)
+        mimetype = 'application/zip'
+    db.session.add(AuditLog(actor_id=current_user.id, action='export_tickets', object_type='event', object_id=event_id,
+                            snapshot=f'format={fmt} tickets={len(tickets)}'))
+    db.session.commit()
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/ticket/<string:qr_token>.png')
 @login_required
 def ticket_qr(qr_token):
 
-    reg = EventRegistration.query.filter(EventRegistration.user_id == current_user.id, EventRegistration.notes.like(f'%qr:{qr_token}%')).first()
-    if not reg:
+    token = verify_ticket_code(qr_token)
+    ticket = None
+    if token:
+        ticket = Ticket.query.join(EventRegistration, Ticket.registration_id == EventRegistration.id).filter(
+            Ticket.token == token,
+            EventRegistration.user_id == current_user.id
+        ).first()
+    if not ticket:
         flash('Invalid ticket token', 'error')
         return redirect(url_for('dashboard'))
+    code = ticket.code
+    response = Response(mimetype='image/png')
+    response.set_etag(QRImageCache.key(code))
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
     try:
-        import qrcode
-        img = qrcode.make(f'CHECKIN:{qr_token}')
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        return send_file(buf, mimetype='image/png')
+        _, png = qr_cache.get(code)
     except Exception:
         flash('QR generation failed', 'error')
         return redirect(url_for('dashboard'))
+    response.set_data(png)
+    return response
 
 @app.route('/checkin/<string:qr_token>')
+@use_primary
 @login_required
 def checkin(qr_token):
 
     if current_user.role not in ['admin', 'coordinator']:
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
-    reg = EventRegistration.query.filter(EventRegistration.notes.like(f'%qr:{qr_token}%')).first()
+    token = verify_ticket_code(qr_token)
+    reg = None
+    if token:
+        reg = EventRegistration.query.join(Ticket, Ticket.registration_id == EventRegistration.id).filter(Ticket.token == token).first()
     if not reg:
         flash('Invalid token', 'error')
         return redirect(url_for('dashboard'))
-    existing = CheckIn.query.filter_by(event_id=reg.event_id, user_id=reg.user_id).first()
-    if existing:
-        flash('Already checked in', 'info')
-        return redirect(url_for('event_detail', event_id=reg.event_id))
-    db.session.add(CheckIn(event_id=reg.event_id, user_id=reg.user_id))
-    db.session.commit()
+    reg_id, event_id, user_id = reg.id, reg.event_id, reg.user_id
+    try:
+        # Under the event lock nobody else can check this ticket in (or cancel it)
+        # between the reads below and the insert.
+        lock_event(event_id)
+        status = db.session.query(EventRegistration.status).filter_by(id=reg_id).scalar()
+        if status == 'cancelled':
+            db.session.rollback()
+            flash('This registration was cancelled', 'error')
+            return redirect(url_for('event_detail', event_id=event_id))
+        if CheckIn.query.filter_by(event_id=event_id, user_id=user_id).first() is not None:
+            db.session.rollback()
+            flash('Already checked in', 'info')
+            return redirect(url_for('event_detail', event_id=event_id))
+        db.session.add(CheckIn(event_id=event_id, user_id=user_id))
+        adjust_event_counters(event_id, checkin_count=1)
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+        app.logger.warning('Check-in for event %s timed out waiting for the database', event_id)
+        flash('The database is busy; scan the ticket again in a few seconds', 'error')
+        return redirect(url_for('event_detail', event_id=event_id))
     flash('Check-in successful', 'success')
-    return redirect(url_for('event_detail', event_id=reg.event_id))
+    return redirect(url_for('event_detail', event_id=event_id))
+
+CHECKIN_BATCH_MAX = 1000
+
+def parse_scan_time(value, now):
+    """A scanner's ISO 8601 timestamp as naive UTC; missing, unparseable or future times become `now`."""
+    try:
+        scanned_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return now
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(scanned_at, now)
+
+def check_in_tickets(event_id, scans):
+    """Check in a batch of scanned (code, scanned_at) pairs for one event and commit.
+
+    The event row is locked first (lock_event), so check-ins for one event are
+    serialised: nobody else can check in one of these tickets between the lookup
+    and the insert. All codes are then resolved with one query (ticket,
+    registration and any existing check-in), and every new CheckIn row goes in
+    with one multi-row INSERT. Returns one result dict per scan, in order.
+    Raises OperationalError if the lock could not be had within busy_timeout.
+    """
+    now = datetime.utcnow()
+    tokens = [verify_ticket_code(code) if isinstance(code, str) else None for code, _ in scans]
+    lock_event(event_id)
+    found = {token: row for token, *row in db.session.query(
+        Ticket.token, EventRegistration.event_id, EventRegistration.user_id, EventRegistration.status,
+        User.username, CheckIn.checked_in_at
+    ).join(EventRegistration, Ticket.registration_id == EventRegistration.id).join(
+        User, User.id == EventRegistration.user_id
+    ).outerjoin(CheckIn, (CheckIn.event_id == EventRegistration.event_id) & (CheckIn.user_id == EventRegistration.user_id)
+    ).filter(Ticket.token.in_({t for t in tokens if t}))}
+
+    results, new_rows, seen = [], [], set()
+    for (code, scanned_at), token in zip(scans, tokens):
+        result = {'code': code}
+        row = found.get(token)
+        if row is None:
+            result['result'] = 'invalid'
+        else:
+            reg_event_id, user_id, status, username, checked_in_at = row
+            result['username'] = username
+            if reg_event_id != event_id:
+                result['result'] = 'wrong_event'
+            elif status == 'cancelled':
+                result['result'] = 'cancelled'
+            elif checked_in_at is not None:
+                result.update(result='already_checked_in', checked_in_at=checked_in_at.isoformat())
+            elif user_id in seen:
+                result['result'] = 'duplicate'
+            else:
+                seen.add(user_id)
+                scanned_at = parse_scan_time(scanned_at, now)
+                new_rows.append({'event_id': event_id, 'user_id': user_id, 'checked_in_at': scanned_at})
+                result.update(result='checked_in', checked_in_at=scanned_at.isoformat())
+        results.append(result)
+
+    if new_rows:
+        db.session.execute(db.insert(CheckIn).values(new_rows))
+        adjust_event_counters(event_id, checkin_count=len(new_rows))
+    db.session.commit()
+    return results
+
+@app.route('/event/<int:event_id>/checkins', methods=['POST'])
+@login_required
+def batch_checkin(event_id):
+    """JSON check-in for scanner stations: {"scans": [{"code": ..., "scanned_at": ISO 8601}, ...]}.
+
+    Stations can queue scans while offline and post them in one go; the reply has
+    a result per scan (checked_in, already_checked_in, duplicate, cancelled,
+    wrong_event or invalid).
+    """
+    event = db.session.get(Event, event_id)
+    if event is None:
+        return jsonify({'error': 'No such event'}), 404
+    if not user_can_manage_event(current_user, event):
+        return jsonify({'error': 'Access denied'}), 403
+    payload = request.get_json(silent=True)
+    scans = payload.get('scans') if isinstance(payload, dict) else None
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'Expected a JSON body with a non-empty "scans" list'}), 400
+    if len(scans) > CHECKIN_BATCH_MAX:
+        return jsonify({'error': f'At most {CHECKIN_BATCH_MAX} scans per request'}), 413
+    scans = [(scan.get('code'), scan.get('scanned_at')) if isinstance(scan, dict) else (scan, None) for scan in scans]
+    try:
+        results = check_in_tickets(event_id, scans)
+    except OperationalError:
+        # Another writer held the database past busy_timeout; nothing was recorded, so
+        # the station can safely send the same batch again.
+        db.session.rollback()
+        app.logger.warning('Batch check-in for event %s timed out waiting for the database', event_id)
+        response = jsonify({'error': 'The database is busy, retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    summary = Counter(result['result'] for result in results)
+    return jsonify({'event_id': event_id, 'summary': summary, 'results': results})
+
+@app.route('/event/<int:event_id>/checkins/manifest.json')
+@login_required
+def checkin_manifest(event_id):
+    """Every ticket code for an event with its holder and check-in state, for offline validation.
+
+    Scanners match codes against this list while offline and sync through
+    batch_checkin later. The ETag lets them re-poll it cheaply.
+    """
+    event = db.session.get(Event, event_id)
+    if event is None:
+        return jsonify({'error': 'No such event'}), 404
+    if not user_can_manage_event(current_user, event):
+        return jsonify({'error': 'Access denied'}), 403
+    tickets = [{
+        'code': ticket_code(token), 'username': username, 'school': school, 'status': status,
+        'checked_in_at': checked_in_at.isoformat() if checked_in_at else None,
+    } for token, username, school, status, checked_in_at in db.session.query(
+        Ticket.token, User.username, User.school, EventRegistration.status, CheckIn.checked_in_at
+    ).join(EventRegistration, Ticket.registration_id == EventRegistration.id).join(
+        User, User.id == EventRegistration.user_id
+    ).outerjoin(CheckIn, (CheckIn.event_id == event_id) & (CheckIn.user_id == EventRegistration.user_id)
+    ).filter(EventRegistration.event_id == event_id).order_by(User.username)]
+    response = jsonify({'event_id': event_id, 'title': event.title, 'event_date': event.event_date.isoformat(),
+                        'signed': bool(app.config.get('TICKET_SIGNING_KEY')), 'tickets': tickets})
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# Export name -> (ordered columns, date column used by ?from=/?to=, joins). Each export is a
+# single flat query so rows can be streamed off the cursor without touching the ORM per row.
+EXPORTS = {
+    'users': ({
+        'id': User.id, 'username': User.username, 'email': User.email,
+        'school': User.school, 'role': User.role, 'created_at': User.created_at,
+    }, User.created_at, []),
+    'events': ({
+        'id': Event.id, 'title': Event.title, 'category': Event.category, 'date': Event.event_date,
+        'location': Event.location, 'status': Event.status, 'max_participants': Event.max_participants,
+        'registrations': Event.registration_count,
+    }, Event.event_date, []),
+    'registrations': ({
+        'id': EventRegistration.id, 'event_id': EventRegistration.event_id, 'event_title': Event.title,
+        'user_id': EventRegistration.user_id, 'username': User.username,
+        'status': EventRegistration.status, 'registration_date': EventRegistration.registration_date,
+    }, EventRegistration.registration_date, [
+        (Event, Event.id == EventRegistration.event_id),
+        (User, User.id == EventRegistration.user_id),
+    ]),
+}
+EXPORT_BATCH_SIZE = 1000
+
+def _parse_export_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def iter_csv_rows(query, header):
+    """Yield CSV text in chunks of EXPORT_BATCH_SIZE rows, reading the query with a server-side cursor."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 0
+    for row in query.execution_options(yield_per=EXPORT_BATCH_SIZE):
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
 
 @app.route('/admin/export/<string:what>.csv')
 @login_required
 def export_csv(what):
+    """Stream an export as CSV.
+
+    Query args: columns=a,b,c to pick columns, from=/to= (YYYY-MM-DD) to bound the export's
+    date column, gzip=1 to compress the stream.
+    """
     if current_user.role != 'admin':
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
-    import csv
-    output = io.StringIO()
-    writer = csv.writer(output)
-    if what == 'users':
-        writer.writerow(['id', 'username', 'email', 'school', 'role', 'created_at'])
-        for u in User.query.all():
-            writer.writerow([u.id, u.username, u.email, u.school, u.role, u.created_at])
-    elif what == 'events':
-        writer.writerow(['id', 'title', 'category', 'date', 'location', 'status', 'max_participants'])
-        for e in Event.query.all():
-            writer.writerow([e.id, e.title, e.category, e.event_date, e.location, e.status, e.max_participants])
-    elif what == 'registrations':
-        writer.writerow(['id', 'event_id', 'event_title', 'user_id', 'username', 'status', 'registration_date'])
-        regs = EventRegistration.query.all()
-        for r in regs:
-            ev = Event.query.get(r.event_id)
-            us = User.query.get(r.user_id)
-            writer.writerow([r.id, r.event_id, ev.title if ev else '', r.user_id, us.username if us else '', r.status, r.registration_date])
-    else:
+    if what not in EXPORTS:
         flash('Unknown export type', 'error')
         return redirect(url_for('admin_panel'))
-    csv_content = output.getvalue()
-    return Response(csv_content, mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={what}.csv'})
+    columns, date_column, joins = EXPORTS[what]
+
+    selected = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+    unknown = [c for c in selected if c not in columns]
+    if unknown:
+        flash(f"Unknown column(s) for {what}: {', '.join(unknown)}", 'error')
+        return redirect(url_for('admin_panel'))
+    header = selected or list(columns)
+
+    query = db.session.query(*[columns[name].label(name) for name in header]).select_from(date_column.class_)
+    for target, onclause in joins:
+        query = query.outerjoin(target, onclause)
+    date_from = _parse_export_date(request.args.get('from'))
+    date_to = _parse_export_date(request.args.get('to'))
+    if date_from:
+        query = query.filter(date_column >= date_from)
+    if date_to:
+        query = query.filter(date_column < date_to + timedelta(days=1))
+    query = query.order_by(columns['id'] if 'id' in columns else date_column)
+
+    filename = f'{what}.csv'
+    chunks = iter_csv_rows(query, header)
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+    if request.args.get('gzip') == '1':
+        chunks = compress_chunks(chunks)
+        headers['Content-Disposition'] = f'attachment; filename={filename}.gz'
+        return Response(stream_with_context(chunks), mimetype='application/gzip', headers=headers)
+    return Response(stream_with_context((c.encode('utf-8') for c in chunks)), mimetype='text/csv', headers=headers)
+
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_ROLES = ('admin', 'coordinator', 'participant')
+
+def hash_passwords(passwords):
+    """Hash many passwords, spread over process_pool(); generate_password_hash is deliberately slow."""
+    passwords = list(passwords)
+    workers = min(app.config['PROCESS_POOL_WORKERS'], max(1, len(passwords) // 50))
+    if workers == 1:
+        return [generate_password_hash(pw) for pw in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(process_pool().map(generate_password_hash, passwords, chunksize=chunksize))
+
+def read_import_csv(stream):
+    """Parse an uploaded/opened CSV into (line number, row dict) pairs with stripped values."""
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    return [(reader.line_num, {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}) for row in reader]
+
+def _existing_values(column, values):
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), IMPORT_CHUNK_SIZE):
+        found.update(v for (v,) in db.session.query(column).filter(column.in_(values[i:i + IMPORT_CHUNK_SIZE])))
+    return found
+
+def import_users(rows, actor_id=None):
+    """Create users from (line, row) pairs with username, email, password, school and optional role.
+
+    The whole batch is validated before anything is written; duplicates within the
+    file and against the database are found with set lookups. Valid rows are hashed
+    in parallel and bulk-inserted in chunks. Returns (created count, [(line, error)]).
+    """
+    errors, valid = [], []
+    seen_usernames, seen_emails = set(), set()
+    for line, row in rows:
+        username, email, password, school = (row.get(k, '') for k in ('username', 'email', 'password', 'school'))
+        role = row.get('role') or 'participant'
+        if not all([username, email, password, school]):
+            errors.append((line, 'username, email, password and school are required'))
+        elif role not in IMPORT_ROLES:
+            errors.append((line, f'unknown role {role!r}'))
+        elif '@' not in email:
+            errors.append((line, f'invalid email {email!r}'))
+        elif username in seen_usernames:
+            errors.append((line, f'duplicate username {username!r} in file'))
+        elif email in seen_emails:
+            errors.append((line, f'duplicate email {email!r} in file'))
+        else:
+            seen_usernames.add(username)
+            seen_emails.add(email)
+            valid.append((line, username, email, password, school, role))
+
+    taken_usernames = _existing_values(User.username, seen_usernames)
+    taken_emails = _existing_values(User.email, seen_emails)
+    rows_to_create = []
+    for line, username, email, password, school, role in valid:
+        if username in taken_usernames:
+            errors.append((line, f'username {username!r} already exists'))
+        elif email in taken_emails:
+            errors.append((line, f'email {email!r} already registered'))
+        else:
+            rows_to_create.append((username, email, password, school, role))
+
+    hashes = hash_passwords(pw for _, _, pw, _, _ in rows_to_create)
+    now = datetime.utcnow()
+    values = [{'username': username, 'email': email, 'password_hash': pw_hash, 'school': school,
+               'role': role, 'created_at': now}
+              for (username, email, _, school, role), pw_hash in zip(rows_to_create, hashes)]
+    for i in range(0, len(values), IMPORT_CHUNK_SIZE):
+        db.session.execute(db.insert(User), values[i:i + IMPORT_CHUNK_SIZE])
+    if values:
+        db.session.add(AuditLog(actor_id=actor_id, action='import_users', object_type='user', snapshot=f'created={len(values)}'))
+    db.session.commit()
+    return len(values), sorted(errors)
+
+def import_registrations(rows, actor_id=None):
+    """Register users for events from (line, row) pairs with event_id and username (or email).
+
+    Seats are handed out in file order up to each event's capacity; rows beyond it are
+    reported as errors rather than waitlisted. Cancelled registrations are reactivated.
+    Registrations and their tickets are bulk-inserted and the event counters adjusted
+    once per event. Returns (created count, [(line, error)]).
+    """
+    errors, parsed = [], []
+    for line, row in rows:
+        login = row.get('username') or row.get('email')
+        try:
+            event_id = int(row.get('event_id', ''))
+        except ValueError:
+            errors.append((line, 'event_id must be a number'))
+            continue
+        if not login:
+            errors.append((line, 'username or email is required'))
+            continue
+        parsed.append((line, event_id, login))
+
+    events = {e.id: e for e in Event.query.filter(Event.id.in_({eid for _, eid, _ in parsed}))}
+    logins = {login for _, _, login in parsed}
+    user_ids = {}
+    for column in (User.email, User.username):
+        values = list(logins)
+        for i in range(0, len(values), IMPORT_CHUNK_SIZE):
+            user_ids.update(db.session.query(column, User.id).filter(column.in_(values[i:i + IMPORT_CHUNK_SIZE])))
+    existing = {}
+    for event_id in events:
+        existing.update(((event_id, uid), status) for uid, status in db.session.query(
+            EventRegistration.user_id, EventRegistration.status).filter_by(event_id=event_id))
+
+    free = {eid: e.max_participants - e.registration_count for eid, e in events.items()}
+    seated, seen = {}, set()
+    for line, event_id, login in parsed:
+        user_id = user_ids.get(login)
+        if event_id not in events:
+            errors.append((line, f'no event with id {event_id}'))
+        elif user_id is None:
+            errors.append((line, f'no user {login!r}'))
+        elif (event_id, user_id) in seen:
+            errors.append((line, f'duplicate of an earlier row for {login!r}'))
+        elif existing.get((event_id, user_id), 'cancelled') != 'cancelled':
+            errors.append((line, f'{login!r} is already registered'))
+        elif free[event_id] <= 0:
+            errors.append((line, f'event {event_id} is full'))
+        else:
+            seen.add((event_id, user_id))
+            free[event_id] -= 1
+            seated.setdefault(event_id, []).append(user_id)
+
+    now = datetime.utcnow()
+    total = 0
+    for event_id, users in seated.items():
+        status = 'registered' if events[event_id].require_approval else 'confirmed'
+        reactivated = [uid for uid in users if (event_id, uid) in existing]
+        if reactivated:
+            EventRegistration.query.filter(
+                EventRegistration.event_id == event_id, EventRegistration.user_id.in_(reactivated)
+            ).update({EventRegistration.status: status, EventRegistration.registration_date: now}, synchronize_session=False)
+        new_rows = [{'event_id': event_id, 'user_id': uid, 'status': status, 'registration_date': now}
+                    for uid in users if (event_id, uid) not in existing]
+        for i in range(0, len(new_rows), IMPORT_CHUNK_SIZE):
+            db.session.execute(db.insert(EventRegistration), new_rows[i:i + IMPORT_CHUNK_SIZE])
+        unticketed = [reg_id for (reg_id,) in db.session.query(EventRegistration.id).outerjoin(
+            Ticket, Ticket.registration_id == EventRegistration.id
+        ).filter(EventRegistration.event_id == event_id, EventRegistration.status != 'cancelled', Ticket.id.is_(None))]
+        tickets = [{'registration_id': reg_id, 'token': str(uuid.uuid4()), 'created_at': now} for reg_id in unticketed]
+        for i in range(0, len(tickets), IMPORT_CHUNK_SIZE):
+            db.session.execute(db.insert(Ticket), tickets[i:i + IMPORT_CHUNK_SIZE])
+        adjust_event_counters(event_id, registration_count=len(users),
+                              confirmed_count=len(users) if status == 'confirmed' else 0)
+        db.session.add(AuditLog(actor_id=actor_id, action='import_registrations', object_type='event',
+                                object_id=event_id, snapshot=f'created={len(users)}'))
+        total += len(users)
+    db.session.commit()
+    return total, sorted(errors)
+
+IMPORTERS = {'users': import_users, 'registrations': import_registrations}
+
+@app.route('/admin/import/<string:what>', methods=['POST'])
+@login_required
+def admin_import(what):
+    if current_user.role != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    if what not in IMPORTERS:
+        flash('Unknown import type', 'error')
+        return redirect(url_for('admin_panel'))
+    f = request.files.get('file')
+    if not f or not f.filename:
+        flash('No file selected', 'error')
+        return redirect(url_for('admin_panel', tab=what))
+    try:
+        rows = read_import_csv(f.stream)
+    except (UnicodeDecodeError, ValueError) as e:
+        flash(f'Could not read CSV: {e}', 'error')
+        return redirect(url_for('admin_panel', tab=what))
+    created, errors = IMPORTERS[what](rows, actor_id=current_user.id)
+    flash(f'Imported {created} {what}, {len(errors)} row(s) skipped', 'success' if not errors else 'warning')
+    for line, message in errors[:20]:
+        flash(f'Line {line}: {message}', 'error')
+    if len(errors) > 20:
+        flash(f'...and {len(errors) - 20} more errors', 'error')
+    return redirect(url_for('admin_panel', tab=what))
 
 
 @app.route('/verify/request')
+@use_primary
 @login_required
 def request_verification():
     existing = EmailVerificationToken.query.filter_by(user_id=current_user.id, verified_at=None).first()
@@ -694,6 +3590,7 @@ def request_verification():
     return redirect(url_for('dashboard'))
 
 @app.route('/verify/<string:token>')
+@use_primary
 def verify_email(token):
     rec = EmailVerificationToken.query.filter_by(token=token).first()
     if not rec or rec.verified_at:
@@ -701,9 +3598,15 @@ def verify_email(token):
         return redirect(url_for('login'))
     rec.verified_at = datetime.utcnow()
 
-    db.session.add(UserMeta(user_id=rec.user_id, key='email_verified', value='1'))
-    db.session.add(Notification(user_id=rec.user_id, title='Email verified', body='Thanks for verifying your email.'))
-    db.session.add(AuditLog(actor_id=rec.user_id, action='verify_email', object_type='user', object_id=rec.user_id))
+    meta = UserMeta.query.filter_by(user_id=rec.user_id, key='email_verified').first()
+    if meta:
+        meta.value = '1'
+    else:
+        db.session.add(UserMeta(user_id=rec.user_id, key='email_verified', value='1'))
+    enqueue_fanout(
+        f'verify_email:{rec.id}', 'Email verified', 'Thanks for verifying your email.', user_ids=[rec.user_id],
+        audit={'actor_id': rec.user_id, 'action': 'verify_email', 'object_type': 'user', 'object_id': rec.user_id}
+    )
     db.session.commit()
     flash('Email verified successfully', 'success')
     return redirect(url_for('dashboard'))
@@ -736,6 +3639,7 @@ def password_reset(token):
             return render_template('password_reset.html')
         user = User.query.get(rec.user_id)
         user.password_hash = generate_password_hash(pw)
+        bump_user_version(user)
         rec.used_at = datetime.utcnow()
         db.session.add(AuditLog(actor_id=user.id, action='password_reset', object_type='user', object_id=user.id))
         db.session.commit()
@@ -752,34 +3656,217 @@ def user_can_manage_event(user: User, event: Event) -> bool:
     return EventCoordinator.query.filter_by(event_id=event.id, user_id=user.id).first() is not None
 
 @app.route('/event/<int:event_id>/registration/<int:reg_id>/approve')
+@use_primary
 @login_required
 def approve_registration(event_id, reg_id):
     event = Event.query.get_or_404(event_id)
     if not user_can_manage_event(current_user, event):
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
-    reg = EventRegistration.query.get_or_404(reg_id)
+    lock_event(event_id)
+    reg = EventRegistration.query.filter_by(id=reg_id, event_id=event_id).first_or_404()
+    if reg.status != 'registered':
+        flash(f'Registration is already {reg.status}', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    adjust_event_counters(event_id, confirmed_count=1)
     reg.status = 'confirmed'
-    db.session.add(Notification(user_id=reg.user_id, title='Registration Approved', body=f'Your registration for {event.title} was approved.'))
-    db.session.add(AuditLog(actor_id=current_user.id, action='approve_registration', object_type='registration', object_id=reg.id))
+    enqueue_fanout(
+        f'approve_registration:{reg.id}:{reg.registration_date.isoformat()}',
+        'Registration Approved', f'Your registration for {event.title} was approved.', user_ids=[reg.user_id],
+        audit={'actor_id': current_user.id, 'action': 'approve_registration', 'object_type': 'registration',
+               'object_id': reg.id}
+    )
     db.session.commit()
     flash('Registration approved', 'success')
     return redirect(url_for('event_detail', event_id=event_id))
 
+@app.route('/event/<int:event_id>/cancel', methods=['POST'])
+@login_required
+def cancel_registration(event_id):
+    event = lock_event(event_id)
+    if event is None:
+        abort(404)
+    reg = EventRegistration.query.filter(
+        EventRegistration.event_id == event_id,
+        EventRegistration.user_id == current_user.id,
+        EventRegistration.status != 'cancelled'
+    ).first()
+    wait = Waitlist.query.filter_by(event_id=event_id, user_id=current_user.id).first()
+    if not reg and not wait:
+        flash('You are not registered for this event', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    if reg:
+        adjust_event_counters(event_id, registration_count=-1, confirmed_count=-int(reg.status == 'confirmed'))
+        reg.status = 'cancelled'
+        db.session.add(AuditLog(actor_id=current_user.id, action='cancel_registration', object_type='registration', object_id=reg.id))
+    if wait:
+        db.session.delete(wait)
+        adjust_event_counters(event_id, waitlist_count=-1)
+        db.session.flush()
+        compact_waitlist(event_id)
+    if reg:
+        promote_waitlist(event_id, actor_id=current_user.id)
+    db.session.commit()
+    flash(f'Your registration for {event.title} has been cancelled', 'info')
+    return redirect(url_for('event_detail', event_id=event_id))
+
+@app.route('/event/<int:event_id>/registration/<int:reg_id>/reject')
+@use_primary
+@login_required
+def reject_registration(event_id, reg_id):
+    event = Event.query.get_or_404(event_id)
+    if not user_can_manage_event(current_user, event):
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    lock_event(event_id)
+    reg = EventRegistration.query.filter_by(id=reg_id, event_id=event_id).first_or_404()
+    if reg.status == 'cancelled':
+        flash('Registration is already cancelled', 'info')
+        return redirect(url_for('event_detail', event_id=event_id))
+    adjust_event_counters(event_id, registration_count=-1, confirmed_count=-int(reg.status == 'confirmed'))
+    reg.status = 'cancelled'
+    notify(reg.user_id, 'Registration Declined', f'Your registration for {event.title} was not approved.')
+    db.session.add(AuditLog(actor_id=current_user.id, action='reject_registration', object_type='registration', object_id=reg.id))
+    promoted = promote_waitlist(event_id, actor_id=current_user.id)
+    db.session.commit()
+    flash(f'Registration rejected. {promoted} promoted from the waitlist.' if promoted else 'Registration rejected', 'success')
+    return redirect(url_for('event_detail', event_id=event_id))
+
+@app.route('/event/<int:event_id>/capacity', methods=['POST'])
+@login_required
+def update_event_capacity(event_id):
+    event = Event.query.get_or_404(event_id)
+    if not user_can_manage_event(current_user, event):
+        flash('Access denied', 'error')
+        return redirect(url_for('event_detail', event_id=event_id))
+    try:
+        capacity = int(request.form.get('max_participants', ''))
+    except ValueError:
+        capacity = 0
+    if capacity < 1:
+        flash('Capacity must be a positive number', 'error')
+        return redirect(url_for('event_detail', event_id=event_id))
+    event = lock_event(event_id)
+    event.max_participants = capacity
+    mark_event_changed(event.id)
+    db.session.add(AuditLog(actor_id=current_user.id, action='update_capacity', object_type='event', object_id=event.id, snapshot=f'max_participants={capacity}'))
+    db.session.flush()
+    promoted = promote_waitlist(event_id, actor_id=current_user.id)
+    db.session.commit()
+    if capacity < event.registration_count:
+        flash(f'Capacity set to {capacity}; existing registrations above it were kept', 'info')
+    else:
+        flash(f'Capacity set to {capacity}. {promoted} promoted from the waitlist.' if promoted else f'Capacity set to {capacity}', 'success')
+    return redirect(url_for('event_detail', event_id=event_id))
+
+def _user_or_address():
+    # One school behind a NAT shares an address, and EventSource reconnects count too.
+    return f'user:{current_user.id}' if current_user.is_authenticated else get_remote_address()
+
+@app.route('/stream')
+@limiter.limit("30 per minute", key_func=_user_or_address)
+def live_stream():
+    """Server-Sent Events: the user's new notifications and, with ?event_id=, that event's seat counts."""
+    channels = []
+    if current_user.is_authenticated:
+        channels.append(f'user:{current_user.id}')
+    event_id = request.args.get('event_id', type=int)
+    if event_id:
+        channels.append(f'event:{event_id}')
+    if not channels:
+        return jsonify({'error': 'Nothing to stream'}), 400
+    if not _sse_slots.acquire(blocking=False):
+        # An error status would make EventSource give up for good; an empty stream with a
+        # retry delay has it reconnect later, spread out so a full server isn't hit all at once.
+        return Response(f'retry: {random.randint(10_000, 30_000)}\n\n', mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    # Until the response owns the slot (and the subscription), any failure must give them back.
+    subscription = None
+    opened = False
+    try:
+        # Resolve everything that needs the database now: the app context (and its DB session)
+        # ends when this view returns, long before the stream does.
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is None:
+            last_event_id = request.args.get('last_event_id', type=int)
+        backlog = []
+        if last_event_id is not None:
+            backlog = [(row.id, row.kind, row.payload) for row in ChangeLog.query.filter(
+                ChangeLog.id > last_event_id, ChangeLog.channel.in_(channels)
+            ).order_by(ChangeLog.id).limit(200)]
+        elif event_id:
+            counts = event_counts(event_id)
+            if counts is not None:
+                latest = db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+                backlog = [(latest, 'counts', json.dumps(counts))]
+        subscription = change_broker.subscribe(channels)
+        heartbeat = app.config['SSE_HEARTBEAT']
+
+        def generate():
+            sent = last_event_id or 0
+            yield 'retry: 3000\n\n'
+            for row in backlog:
+                sent = max(sent, row[0])
+                yield format_sse(*row)
+            while True:
+                try:
+                    row = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                if row[0] <= sent and row[1] != 'counts':
+                    continue
+                sent = max(sent, row[0])
+                yield format_sse(*row)
+
+        def close():
+            change_broker.unsubscribe(subscription, channels)
+            _sse_slots.release()
+
+        response = Response(generate(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(close)
+        opened = True
+        return response
+    finally:
+        if not opened:
+            if subscription is not None:
+                change_broker.unsubscribe(subscription, channels)
+            _sse_slots.release()
+
 @app.route('/notifications')
 @login_required
 def notifications_list():
-    items = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
-    return render_template('notifications.html', notifications=items)
+    items, next_cursor = paginate_keyset(
+        Notification.query.filter_by(user_id=current_user.id),
+        [(Notification.created_at, True), (Notification.id, True)],
+        request.args.get('cursor'), per_page=ROWS_PER_PAGE
+    )
+    next_url = url_for('notifications_list', cursor=next_cursor) if next_cursor else None
+    return render_template('notifications.html', notifications=items, next_url=next_url)
 
 @app.route('/notifications/<int:notif_id>/read')
+@use_primary
 @login_required
 def notifications_mark_read(notif_id):
     n = Notification.query.filter_by(id=notif_id, user_id=current_user.id).first_or_404()
-    n.read_at = datetime.utcnow()
+    marked = Notification.query.filter_by(id=n.id, read_at=None).update(
+        {Notification.read_at: datetime.utcnow()}, synchronize_session=False)
+    adjust_unread_notifications(current_user.id, -marked)
     db.session.commit()
     return redirect(url_for('notifications_list'))
 
+@app.route('/notifications/read-all', methods=['POST'])
+@login_required
+def notifications_mark_all_read():
+    marked = Notification.query.filter_by(user_id=current_user.id, read_at=None).update(
+        {Notification.read_at: datetime.utcnow()}, synchronize_session=False)
+    adjust_unread_notifications(current_user.id, -marked)
+    db.session.commit()
+    flash(f'Marked {marked} notification(s) as read', 'success')
+    return redirect(url_for('notifications_list'))
+
 @app.route('/create_event', methods=['GET', 'POST'])
 @login_required
 def create_event():
@@ -817,17 +3904,60 @@ def admin_panel():
         flash('Access denied', 'error')
         return redirect(url_for('dashboard'))
     
-    users = User.query.all()
-    events = Event.query.all()
-    registrations = EventRegistration.query.all()
+    tab = request.args.get('tab', 'users')
+    cursor = request.args.get('cursor')
+    users, users_cursor = paginate_keyset(
+        User.query, [(User.id, False)],
+        cursor if tab == 'users' else None, per_page=ROWS_PER_PAGE
+    )
+    events, events_cursor = paginate_keyset(
+        Event.query.options(db.joinedload(Event.creator)), [(Event.id, False)],
+        cursor if tab == 'events' else None, per_page=ROWS_PER_PAGE
+    )
+    registrations, registrations_cursor = paginate_keyset(
+        EventRegistration.query.options(db.joinedload(EventRegistration.user), db.joinedload(EventRegistration.event)),
+        [(EventRegistration.id, True)],
+        cursor if tab == 'registrations' else None, per_page=ROWS_PER_PAGE
+    )
+    next_urls = {
+        name: url_for('admin_panel', tab=name, cursor=next_cursor) if next_cursor else None
+        for name, next_cursor in (('users', users_cursor), ('events', events_cursor), ('registrations', registrations_cursor))
+    }
+
+    roles = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all())
+    stats = {
+        'users': sum(roles.values()),
+        'events': Event.query.count(),
+        'registrations': EventRegistration.query.count(),
+        'schools': db.session.query(db.func.count(db.distinct(User.school))).scalar(),
+        'active_events': Event.query.filter(Event.status.in_(['upcoming', 'ongoing'])).count(),
+        'roles': roles,
+    }
     
+    return render_template('admin.html', users=users, events=events, registrations=registrations,
+                           stats=stats, tab=tab, next_urls=next_urls)
 
-    for event in events:
-        event.registration_count = EventRegistration.query.filter_by(event_id=event.id).count()
-    
-    return render_template('admin.html', users=users, events=events, registrations=registrations)
+@app.route('/admin/cache-stats')
+@login_required
+def admin_cache_stats():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify({name: cache.stats() for name, cache in CACHES.items()})
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Request and SQL metrics of every worker in the Prometheus text format; for scrapers and admins."""
+    token = app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())) and not (
+            current_user.is_authenticated and current_user.role == 'admin'):
+        abort(403)
+    return Response(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
 
 @app.route('/admin/user/<int:user_id>/toggle_role')
+@use_primary
 @login_required
 def toggle_user_role(user_id):
     if current_user.role != 'admin':
@@ -841,12 +3971,14 @@ def toggle_user_role(user_id):
         user.role = 'coordinator'
     else:
         user.role = 'admin'
+    bump_user_version(user)
     
     db.session.commit()
     flash(f'User {user.username} role changed to {user.role}', 'success')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/event/<int:event_id>/toggle_status')
+@use_primary
 @login_required
 def toggle_event_status(event_id):
     if current_user.role != 'admin':
@@ -867,20 +3999,6 @@ def toggle_event_status(event_id):
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
-        
-
-        admin = User.query.filter_by(role='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@school.com',
-                password_hash=generate_password_hash('admin123'),
-                role='admin',
-                school='Main School'
-            )
-            db.session.add(admin)
-            db.session.commit()
-            print("Admin user created: username=admin, password=admin123")
+        ensure_database_initialized()
     
     app.run(debug=True)
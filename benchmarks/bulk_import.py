@@ -0,0 +1,81 @@
+"""Bulk user import benchmark: parallel password hashing and chunked inserts.
+
+Generates a CSV of new accounts (10k by default), imports it through
+import_users() and reports how long validation, hashing and the inserts took,
+next to a serial hashing estimate from a small sample. Password hashing
+dominates; the rest should be a few seconds even for 10k rows.
+
+    python -m benchmarks.bulk_import
+    python -m benchmarks.bulk_import --users 2000
+
+Uses a throwaway SQLite file unless DATABASE_URL is set (then it must be a
+scratch database: the accounts are inserted into its user table).
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+_TEMP_DB = None
+if not os.environ.get('DATABASE_URL'):
+    _TEMP_DB = os.path.join(tempfile.gettempdir(), 'procur_import_bench.db')
+    if os.path.exists(_TEMP_DB):
+        os.remove(_TEMP_DB)
+    os.environ['DATABASE_URL'] = f'sqlite:///{_TEMP_DB}'
+
+import app as procur  # noqa: E402
+from app import app, User, generate_password_hash, read_import_csv, import_users, ensure_database_initialized  # noqa: E402
+
+
+def build_csv(count):
+    lines = ['username,email,password,school']
+    lines += [f'bench{i},bench{i}@example.com,pass-{i:06d},School {i % 40}' for i in range(count)]
+    # A few bad rows so the validation path is exercised too.
+    lines += ['bench1,dup@example.com,pw,School 1', 'nobody,not-an-email,pw,School 1']
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        ensure_database_initialized()
+    sample = 20
+    started = time.perf_counter()
+    for i in range(sample):
+        generate_password_hash(f'sample-{i}')
+    per_hash = (time.perf_counter() - started) / sample
+    print(f'{os.cpu_count()} core(s), {per_hash * 1000:.0f} ms per password hash '
+          f'-> ~{per_hash * args.users:.0f}s to hash {args.users} serially')
+
+    hashing = []
+    original = procur.hash_passwords
+
+    def timed_hash(passwords):
+        started = time.perf_counter()
+        result = original(passwords)
+        hashing.append(time.perf_counter() - started)
+        return result
+
+    procur.hash_passwords = timed_hash
+    with app.app_context():
+        before = User.query.count()
+        started = time.perf_counter()
+        rows = read_import_csv(io.StringIO(build_csv(args.users)))
+        created, errors = import_users(rows)
+        total = time.perf_counter() - started
+        assert User.query.count() == before + created
+    procur.hash_passwords = original
+
+    print(f'imported {created} users ({len(errors)} rejected) in {total:.1f}s: '
+          f'hashing {hashing[0]:.1f}s, everything else {total - hashing[0]:.1f}s')
+
+    if _TEMP_DB:
+        os.remove(_TEMP_DB)
+
+
+if __name__ == '__main__':
+    main()
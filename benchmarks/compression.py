@@ -0,0 +1,146 @@
+"""Response compression benchmark: bytes on the wire and CPU per request, per encoding.
+
+Seeds the sample data, then requests the main pages (as an anonymous visitor,
+a participant, a coordinator or the admin) with `Accept-Encoding: identity`,
+`gzip` and `br`, and reports the response size for each, the CPU time of a
+whole uncompressed request, and the CPU time compress_response adds: the
+compressor run alone on that page at the app's levels, which is steadier than
+the difference between two request timings. Also checks that the streamed CSV export is
+compressed chunk by chunk and that the event stream is left alone.
+
+    python -m benchmarks.compression
+    python -m benchmarks.compression --repeat 200
+
+Uses a throwaway SQLite file unless DATABASE_URL is set (then it must be a
+scratch database: sample data is created in it).
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+_TEMP_DB = None
+if not os.environ.get('DATABASE_URL'):
+    _TEMP_DB = os.path.join(tempfile.gettempdir(), 'procur_compression_bench.db')
+    if os.path.exists(_TEMP_DB):
+        os.remove(_TEMP_DB)
+    os.environ['DATABASE_URL'] = f'sqlite:///{_TEMP_DB}'
+# The pages are requested with logged-in sessions, which need a signing key.
+os.environ.setdefault('SECRET_KEY', 'compression-bench')
+
+from app import app, brotli, limiter, Event, GZIP_LEVEL, BROTLI_QUALITY  # noqa: E402
+from sample_data import create_sample_data  # noqa: E402
+
+ENCODINGS = ['identity', 'gzip'] + (['br'] if brotli else [])
+
+
+def pages(event_id):
+    return [
+        (None, '/'),
+        (None, '/events'),
+        (None, '/events?format=json'),
+        (None, f'/event/{event_id}'),
+        (None, '/calendar/events.ics'),
+        ('student', '/dashboard'),
+        ('coordinator', f'/event/{event_id}'),
+        ('coordinator', f'/event/{event_id}/checkins/manifest.json'),
+        ('admin', '/admin'),
+        ('admin', '/admin?tab=registrations'),
+        ('admin', '/admin/export/registrations.csv'),
+    ]
+
+
+def decode(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        return brotli.decompress(body)
+    return body
+
+
+COMPRESSORS = {
+    'gzip': lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL),
+    'br': lambda data: brotli.compress(data, quality=BROTLI_QUALITY),
+}
+
+
+def cpu_ms(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def fetch(client, url, encoding):
+    """The body of one page as sent with `Accept-Encoding: encoding`, checked against its Content-Encoding."""
+    response = client.get(url, headers={'Accept-Encoding': encoding})
+    body = response.get_data()
+    sent = response.headers.get('Content-Encoding', 'identity')
+    assert response.status_code == 200, (url, response.status_code)
+    assert sent == encoding or len(body) < app.config['COMPRESS_MIN_SIZE'], (url, encoding, sent)
+    assert 'Accept-Encoding' in response.vary, url
+    decode(body, sent)  # raises if the body is not what Content-Encoding says
+    return body
+
+
+def check_streams(clients, event_id):
+    response = clients['admin'].get('/admin/export/registrations.csv', headers={'Accept-Encoding': 'gzip'},
+                                    buffered=False)
+    streamed = response.is_streamed and 'Content-Length' not in response.headers
+    text = gzip.decompress(response.get_data()).decode()
+    print(f"CSV export: Content-Encoding={response.headers.get('Content-Encoding')}, streamed={streamed}, "
+          f"{text.count(chr(10))} lines after decompression")
+    response = clients[None].get(f'/stream?event_id={event_id}', headers={'Accept-Encoding': 'gzip, br'},
+                                 buffered=False)
+    print(f"Event stream: Content-Type={response.mimetype}, "
+          f"Content-Encoding={response.headers.get('Content-Encoding', 'none')}")
+    response.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50, help='requests per page and encoding')
+    args = parser.parse_args()
+
+    create_sample_data()
+    limiter.enabled = False  # hundreds of requests from one address would soon be refused
+    with app.app_context():
+        event_id = Event.query.order_by(Event.id).first().id
+    passwords = {'student': ('student1', 'student123'), 'coordinator': ('coordinator1', 'coord123'),
+                 'admin': ('admin', 'admin123')}
+    clients = {None: app.test_client()}
+    for who, (username, password) in passwords.items():
+        clients[who] = app.test_client()
+        clients[who].post('/login', data={'username': username, 'password': password})
+
+    header = f"{'page':<52}" + ''.join(f'{e + " bytes":>15}' for e in ENCODINGS)
+    header += f"{'request ms':>12}" + ''.join(f'{"+" + e + " ms":>10}' for e in ENCODINGS[1:])
+    print(f'CPU time averaged over {args.repeat} runs; gzip level {GZIP_LEVEL}, brotli quality {BROTLI_QUALITY}')
+    print(header)
+    totals = {encoding: 0 for encoding in ENCODINGS}
+    for who, url in pages(event_id):
+        client = clients[who]
+        sizes = {encoding: len(fetch(client, url, encoding)) for encoding in ENCODINGS}
+        body = fetch(client, url, 'identity')
+        request_ms = cpu_ms(lambda: client.get(url, headers={'Accept-Encoding': 'identity'}).get_data(), args.repeat)
+        line = f"{url + ' as ' + (who or 'anonymous'):<52}{sizes['identity']:>15}"
+        for encoding in ENCODINGS[1:]:
+            line += f"{sizes[encoding]:>9} ({sizes[encoding] / sizes['identity']:>3.0%})"
+        line += f'{request_ms:>12.2f}'
+        for encoding in ENCODINGS[1:]:
+            compressed = len(body) >= app.config['COMPRESS_MIN_SIZE']
+            line += f'{cpu_ms(lambda: COMPRESSORS[encoding](body), args.repeat) if compressed else 0:>+10.2f}'
+        for encoding in ENCODINGS:
+            totals[encoding] += sizes[encoding]
+        print(line)
+    print('total bytes: ' + ', '.join(f'{e} {totals[e]} ({totals[e] / totals["identity"]:.0%})' for e in ENCODINGS))
+
+    check_streams(clients, event_id)
+
+    if _TEMP_DB:
+        os.remove(_TEMP_DB)
+
+
+if __name__ == '__main__':
+    main()
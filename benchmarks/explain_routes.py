@@ -0,0 +1,178 @@
+"""Query plan check: EXPLAIN every SQL statement the main routes run.
+
+Seeds the sample data, requests each route below through the test client
+(as an anonymous visitor, a participant, a coordinator or the admin), records
+the statements it sends and prints the database's plan for each one. Plans
+that read a whole table are marked `!!`. Plans marked `~~` walk a table in
+index or primary-key order and stop at a LIMIT, like the keyset-paginated
+lists. Plans marked `ok` find their rows through an index.
+
+    python -m benchmarks.explain_routes
+    python -m benchmarks.explain_routes --scans-only
+
+On PostgreSQL sequential scans are switched off for the EXPLAIN, so a
+`Seq Scan` in the output means there is no usable index at all rather than the
+planner preferring a scan of a small table.
+
+Uses a throwaway SQLite file unless DATABASE_URL is set (then it must be a
+scratch database: sample data is created and some routes write to it).
+"""
+import argparse
+import os
+import re
+import tempfile
+
+_TEMP_DB = None
+if not os.environ.get('DATABASE_URL'):
+    _TEMP_DB = os.path.join(tempfile.gettempdir(), 'procur_explain.db')
+    if os.path.exists(_TEMP_DB):
+        os.remove(_TEMP_DB)
+    os.environ['DATABASE_URL'] = f'sqlite:///{_TEMP_DB}'
+# The routes are requested with logged-in sessions, which need a signing key.
+os.environ.setdefault('SECRET_KEY', 'explain-routes')
+
+from sqlalchemy import event as sa_event  # noqa: E402
+
+from app import app, db, limiter, User, Event, EventRegistration, Ticket, ticket_code  # noqa: E402
+from sample_data import create_sample_data  # noqa: E402
+
+# Statements worth planning; PRAGMAs, transaction control and INSERTs have no plan to speak of.
+PLANNED = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE)\b', re.IGNORECASE)
+SQLITE_TABLE_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(?!anon_)(?!\()(\S+)$')
+LIMITED = re.compile(r'\bLIMIT\b(?![^()]*\))', re.IGNORECASE)
+
+
+def routes(ids):
+    """(who, method, url, form/json) for every route worth checking, filled in with sample ids."""
+    event, reg, code, token = ids['event'], ids['registration'], ids['code'], ids['calendar_token']
+    return [
+        (None, 'GET', '/', None),
+        (None, 'GET', '/events', None),
+        (None, 'GET', '/events?status=upcoming&sort_by=date_asc', None),
+        (None, 'GET', '/events?category=sports&date_range=month', None),
+        (None, 'GET', '/events?sort_by=popular', None),
+        (None, 'GET', '/events?q=science', None),
+        (None, 'GET', '/api/events/search?q=scie', None),
+        (None, 'GET', '/calendar/events.ics', None),
+        (None, 'GET', f'/calendar/{token}.ics', None),
+        ('student', 'GET', '/dashboard', None),
+        ('student', 'GET', f'/event/{event}', None),
+        ('student', 'GET', f'/event/{event}/calendar.ics', None),
+        ('student', 'GET', '/calendar/feed.ics', None),
+        ('student', 'GET', f'/ticket/{code}.png', None),
+        ('student', 'GET', '/notifications', None),
+        ('student', 'POST', f'/event/{event}/comment', {'body': 'Looking forward to it'}),
+        ('coordinator', 'GET', '/dashboard', None),
+        ('coordinator', 'GET', f'/event/{event}', None),
+        ('coordinator', 'GET', f'/event/{event}/checkins/manifest.json', None),
+        ('coordinator', 'POST', f'/event/{event}/checkins', {'json': {'scans': [code, 'bogus']}}),
+        ('coordinator', 'GET', f'/event/{event}/registration/{reg}/approve', None),
+        ('admin', 'GET', '/admin', None),
+        ('admin', 'GET', '/admin?tab=registrations', None),
+        ('admin', 'GET', '/admin/export/registrations.csv', None),
+    ]
+
+
+def sample_ids():
+    with app.app_context():
+        student = User.query.filter_by(username='student1').one()
+        coordinator = User.query.filter_by(username='coordinator1').one()
+        event_id, reg_id, token = db.session.query(Event.id, EventRegistration.id, Ticket.token).join(
+            EventRegistration, EventRegistration.event_id == Event.id
+        ).join(Ticket, Ticket.registration_id == EventRegistration.id).filter(
+            EventRegistration.user_id == student.id, Event.created_by == coordinator.id
+        ).first()
+        student.calendar_token = 'explain-routes-token'
+        db.session.commit()
+        return {'event': event_id, 'registration': reg_id, 'code': ticket_code(token),
+                'calendar_token': student.calendar_token}
+
+
+def explain(connection, statement, parameters):
+    """Plan lines for a statement and its mark: 'ok', '~~' (scan cut short by LIMIT) or '!!' (table scan)."""
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()
+        lines = [row[0] for row in rows]
+        scan = any('Seq Scan' in line for line in lines)
+        sorted_in_memory = any(line.lstrip(' ->').startswith('Sort') for line in lines)
+    else:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        lines = [row[-1] for row in rows]
+        scan = any(SQLITE_TABLE_SCAN.match(line) for line in lines)
+        sorted_in_memory = any('TEMP B-TREE' in line for line in lines)
+    if not scan:
+        return lines, 'ok'
+    if LIMITED.search(statement) and not sorted_in_memory:
+        return lines, '~~'
+    return lines, '!!'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scans-only', action='store_true', help='only print statements that are not index-backed')
+    args = parser.parse_args()
+
+    create_sample_data()
+    # Rate-limit counters outlive the run (they are shared by all processes), so repeated
+    # runs from the same address would soon be refused.
+    limiter.enabled = False
+    ids = sample_ids()
+    passwords = {'student': ('student1', 'student123'), 'coordinator': ('coordinator1', 'coord123'),
+                 'admin': ('admin', 'admin123')}
+    clients = {None: app.test_client()}
+    for who, (username, password) in passwords.items():
+        clients[who] = app.test_client()
+        clients[who].post('/login', data={'username': username, 'password': password})
+
+    # Requests must not run inside an outer app context: it would share `g` (and so the
+    # logged-in user) and the database session between them.
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and PLANNED.match(statement):
+            statements.append((statement, parameters))
+
+    plans = {}
+    for who, method, url, body in routes(ids):
+        statements.clear()
+        sa_event.listen(engine, 'before_cursor_execute', record)
+        if method == 'GET':
+            response = clients[who].get(url)
+        elif body and 'json' in body:
+            response = clients[who].post(url, json=body['json'])
+        else:
+            response = clients[who].post(url, data=body)
+        response.get_data()
+        sa_event.remove(engine, 'before_cursor_execute', record)
+
+        results = []
+        with engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            for statement, parameters in statements:
+                if statement not in plans:
+                    plans[statement] = explain(connection, statement, parameters)
+                results.append((statement, *plans[statement]))
+
+        scans = sum(1 for _, _, mark in results if mark == '!!')
+        print(f'\n{method} {url} as {who or "anonymous"} -> {response.status_code}, '
+              f'{len(results)} statement(s), {scans} with table scans')
+        for statement, lines, mark in results:
+            if args.scans_only and mark == 'ok':
+                continue
+            print(f"  {mark} {' '.join(statement.split())[:110]}")
+            for line in lines:
+                print(f'       {line}')
+
+    marks = [mark for _, mark in plans.values()]
+    print(f"\n{len(plans)} distinct statements: {marks.count('ok')} index-backed, "
+          f"{marks.count('~~')} bounded scans, {marks.count('!!')} table scans")
+
+    if _TEMP_DB:
+        os.remove(_TEMP_DB)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Rate limiter benchmark: what the limiter adds to each login/register request.
+
+Posts failing logins (unknown user) and failing sign-ups (taken username) from
+a fresh client address each time, so no request is actually refused and no
+password is hashed, alternating between the limiter switched off and on,
+for each storage backend. Each backend runs in its own process, configured through
+RATELIMIT_STORAGE_URI the same way the app is. Then several processes hammer
+one key to check that the shared SQLite counters add up across processes,
+which per-process memory:// counters cannot do.
+
+    python -m benchmarks.rate_limit
+    python -m benchmarks.rate_limit --requests 5000
+
+Uses a throwaway SQLite file unless DATABASE_URL is set (then it must be a
+scratch database: a benchmark user is added to it).
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Shared with the child processes through the environment.
+_TEMP_DIR = os.environ.get('PROCUR_BENCH_DIR') or tempfile.mkdtemp(prefix='procur_ratelimit_bench_')
+os.environ['PROCUR_BENCH_DIR'] = _TEMP_DIR
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TEMP_DIR, 'app.db')}"
+os.environ.setdefault('SECRET_KEY', 'rate-limit-bench')
+os.environ.setdefault('RATELIMIT_STORAGE_URI', f"sqlite-ratelimit:///{os.path.join(_TEMP_DIR, 'limits.db')}")
+
+from app import app, limiter, ensure_database_initialized  # noqa: E402
+
+BACKENDS = {
+    'memory (per process)': 'memory://',
+    'sqlite (shared)': f"sqlite-ratelimit:///{os.path.join(_TEMP_DIR, 'limits.db')}",
+}
+
+
+def time_requests(count):
+    """Mean microseconds per failing login and sign-up, without and with the limiter.
+
+    Requests alternate between the two settings so drift (GC, caches warming up)
+    lands on both sides equally. Every request comes from its own address.
+    """
+    client = app.test_client()
+    results = {}
+    for name, url, form in [
+        ('login', '/login', {'username': 'nobody-here', 'password': 'x'}),
+        ('register', '/register', {'username': 'admin', 'email': 'a@b.c', 'password': 'x', 'school': 'S'}),
+    ]:
+        elapsed = {False: 0.0, True: 0.0}
+        for i in range(2 * count):
+            limiter.enabled = enabled = bool(i % 2)
+            address = f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+            started = time.perf_counter()
+            response = client.post(url, data=form, environ_base={'REMOTE_ADDR': address})
+            elapsed[enabled] += time.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+        results[name] = (elapsed[False] / count * 1e6, elapsed[True] / count * 1e6)
+    return results
+
+
+def child(count):
+    with app.app_context():
+        ensure_database_initialized()
+    time_requests(min(count, 200))  # warm up templates and connections
+    for name, (off, on) in time_requests(count).items():
+        print(f'result {name} {off:.1f} {on:.1f}')
+
+
+def _hammer(args):
+    key, hits = args
+    storage = limiter.storage
+    started = time.perf_counter()
+    for _ in range(hits):
+        storage.incr(key, 60)
+    return hits, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route and configuration')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.requests)
+        return
+
+    print(f"{'storage':<22}{'route':<10}{'no limiter us':>15}{'limiter us':>12}{'overhead us':>13}")
+    for label, uri in BACKENDS.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.rate_limit', '--child', '--requests', str(args.requests)],
+            env={**os.environ, 'RATELIMIT_STORAGE_URI': uri}, capture_output=True, text=True, check=True,
+        ).stdout
+        for line in output.splitlines():
+            if not line.startswith('result '):
+                continue
+            _, route, off, on = line.split()
+            print(f'{label:<22}{route:<10}{float(off):>15.1f}{float(on):>12.1f}{float(on) - float(off):>13.1f}')
+
+    hits = 2000
+    limiter.storage.clear('bench-shared-key')
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        results = pool.map(_hammer, [('bench-shared-key', hits)] * args.processes)
+    total = sum(n for n, _ in results)
+    per_hit = sum(seconds for _, seconds in results) / total * 1e6
+    counted = limiter.storage.get('bench-shared-key')
+    print(f'{args.processes} processes x {hits} hits on one key: counter={counted} (expected {total}), '
+          f'{per_hit:.0f} us per hit under contention  [{"ok" if counted == total else "FAIL"}]')
+
+    shutil.rmtree(_TEMP_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Concurrency stress test for the registration path.
+
+Fires thousands of simultaneous registrations for one capacity-limited event from
+several processes (standing in for gunicorn workers), each running a pool of
+threads, then checks that the event was not overbooked and that the waitlist has
+no duplicate entries or positions.
+
+    python -m benchmarks.registration_stress --users 3000 --capacity 500
+    DATABASE_URL=postgresql://localhost/procur_stress python -m benchmarks.registration_stress
+
+Uses a throwaway SQLite file unless DATABASE_URL is set. Rows created against a
+real DATABASE_URL are removed again at the end.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+_TEMP_DB = None
+if not os.environ.get('DATABASE_URL'):
+    _TEMP_DB = os.path.join(tempfile.gettempdir(), 'procur_registration_stress.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{_TEMP_DB}'
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import (app, db, User, Event, EventRegistration, Ticket, Waitlist, register_for_event,  # noqa: E402
+                 ensure_database_initialized)
+
+
+def _register(event_id, user_id, retries=10):
+    started = time.perf_counter()
+    for attempt in range(retries):
+        with app.app_context():
+            try:
+                event = db.session.get(Event, event_id)
+                outcome, _ = register_for_event(event, user_id)
+                if outcome in ('registered', 'waitlisted'):
+                    db.session.commit()
+                return outcome, time.perf_counter() - started
+            except OperationalError:
+                # SQLite gives up with "database is locked" once its busy timeout expires.
+                db.session.rollback()
+                time.sleep(0.01 * (attempt + 1))
+    return 'error', time.perf_counter() - started
+
+
+def _worker(args):
+    event_id, user_ids, threads = args
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda uid: _register(event_id, uid), user_ids))
+
+
+def _setup(users, capacity):
+    with app.app_context():
+        creator = User.query.filter_by(role='admin').first()
+        event = Event(title='Stress test event', description='Registration stress test', location='Nowhere',
+                      category='technical', event_date=datetime.now() + timedelta(days=30),
+                      registration_deadline=datetime.now() + timedelta(days=20),
+                      max_participants=capacity, created_by=creator.id)
+        db.session.add(event)
+        db.session.flush()
+        prefix = f'stress{event.id}_'
+        db.session.execute(db.insert(User), [
+            {'username': f'{prefix}{i}', 'email': f'{prefix}{i}@stress.test', 'password_hash': '!',
+             'role': 'participant', 'school': 'Stress School', 'created_at': datetime.utcnow()}
+            for i in range(users)
+        ])
+        db.session.commit()
+        user_ids = [u for (u,) in db.session.query(User.id).filter(User.username.like(f'{prefix}%'))]
+        return event.id, user_ids
+
+
+def _verify(event_id, users, capacity):
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        active = EventRegistration.query.filter(EventRegistration.event_id == event_id,
+                                                EventRegistration.status != 'cancelled').count()
+        distinct_users = db.session.query(db.func.count(db.distinct(EventRegistration.user_id))).filter_by(event_id=event_id).scalar()
+        total_rows = EventRegistration.query.filter_by(event_id=event_id).count()
+        positions = [p for (p,) in db.session.query(Waitlist.position).filter_by(event_id=event_id)]
+        both = db.session.query(Waitlist.user_id).join(
+            EventRegistration, db.and_(EventRegistration.event_id == Waitlist.event_id,
+                                       EventRegistration.user_id == Waitlist.user_id)
+        ).filter(Waitlist.event_id == event_id).count()
+        checks = {
+            'not overbooked': active <= capacity,
+            'every seat filled': active == min(users, capacity),
+            'counter matches rows': event.registration_count == active,
+            'no duplicate registrations': distinct_users == total_rows,
+            'everyone else waitlisted': len(positions) == users - active,
+            'waitlist counter matches rows': event.waitlist_count == len(positions),
+            'no duplicate waitlist positions': len(set(positions)) == len(positions),
+            'nobody both registered and waitlisted': both == 0,
+        }
+        print(f'registrations={active}/{capacity} waitlist={len(positions)} counter={event.registration_count}')
+        return checks
+
+
+def _cleanup(event_id):
+    with app.app_context():
+        prefix = f'stress{event_id}_'
+        reg_ids = db.select(EventRegistration.id).where(EventRegistration.event_id == event_id)
+        Ticket.query.filter(Ticket.registration_id.in_(reg_ids)).delete(synchronize_session=False)
+        EventRegistration.query.filter_by(event_id=event_id).delete(synchronize_session=False)
+        Waitlist.query.filter_by(event_id=event_id).delete(synchronize_session=False)
+        Event.query.filter_by(id=event_id).delete(synchronize_session=False)
+        User.query.filter(User.username.like(f'{prefix}%')).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=3000, help='distinct users registering')
+    parser.add_argument('--capacity', type=int, default=500, help='max_participants of the event')
+    parser.add_argument('--processes', type=int, default=4, help='worker processes (gunicorn workers)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--repeat', type=int, default=2, help='attempts per user, to exercise duplicate submits')
+    args = parser.parse_args()
+
+    with app.app_context():
+        ensure_database_initialized()
+    event_id, user_ids = _setup(args.users, args.capacity)
+    attempts = [uid for uid in user_ids for _ in range(args.repeat)]
+    chunks = [(event_id, attempts[i::args.processes], args.threads) for i in range(args.processes)]
+
+    started = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+        results = [r for chunk in pool.map(_worker, chunks) for r in chunk]
+    elapsed = time.perf_counter() - started
+
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    print(f'{len(results)} attempts in {elapsed:.2f}s -> {len(results) / elapsed:.0f} registrations/s')
+    print(f'latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms '
+          f'p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms')
+    print('outcomes: ' + ', '.join(f'{k}={v}' for k, v in sorted(outcomes.items())))
+
+    checks = _verify(event_id, args.users, args.capacity)
+    checks['no failed attempts'] = 'error' not in outcomes
+    for name, ok in checks.items():
+        print(f"  [{'ok' if ok else 'FAIL'}] {name}")
+
+    if _TEMP_DB:
+        os.remove(_TEMP_DB)
+    else:
+        _cleanup(event_id)
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
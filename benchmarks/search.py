@@ -0,0 +1,127 @@
+"""Event search benchmark: full-text index vs. the old four-way ILIKE scan.
+
+Builds a synthetic catalog (100k events by default), then times the same
+searches through search_events() (FTS5 on SQLite, tsvector on PostgreSQL) and
+through ilike_search_events(), both for the full /events result list and for
+the 8-row typeahead lookup the search box makes.
+
+    python -m benchmarks.search
+    python -m benchmarks.search --events 20000 --runs 50
+
+Uses a throwaway SQLite file unless DATABASE_URL is set (then it must be an
+empty scratch database: the catalog is inserted into its event table).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_TEMP_DB = None
+if not os.environ.get('DATABASE_URL'):
+    _TEMP_DB = os.path.join(tempfile.gettempdir(), 'procur_search_bench.db')
+    if os.path.exists(_TEMP_DB):
+        os.remove(_TEMP_DB)
+    os.environ['DATABASE_URL'] = f'sqlite:///{_TEMP_DB}'
+
+from app import (app, db, User, Event, search_backend, search_events, ilike_search_events,  # noqa: E402
+                 ensure_database_initialized)
+
+ADJECTIVES = ['Annual', 'Inter-School', 'District', 'Regional', 'Junior', 'Senior', 'Open', 'Winter', 'Summer', 'Grand']
+SUBJECTS = ['Science', 'Robotics', 'Basketball', 'Badminton', 'Debate', 'Poetry', 'Chess', 'Music', 'Drama',
+            'Mathematics', 'Astronomy', 'Painting', 'Athletics', 'Coding', 'Quiz', 'Dance', 'Photography']
+FORMATS = ['Fair', 'Championship', 'Tournament', 'Workshop', 'Olympiad', 'Festival', 'Showcase', 'Hackathon', 'Bowl']
+PLACES = ['Central Auditorium', 'Sports Complex', 'Community Arts Center', 'Lincoln High Library',
+          'Roosevelt Middle School', 'Riverside Campus', 'City Hall Annex', 'Main Field']
+CATEGORIES = ['technical', 'sports', 'cultural', 'academic', 'literary', 'art', 'music', 'drama']
+FILLER = ('students teams schools judges awards rounds finals district state regional projects showcase '
+          'categories participants coaches volunteers mentors guests registration schedule venue lunch').split()
+
+QUERIES = ['robotics', 'basket', 'poetry workshop', 'riverside', 'grand championship chess', 'astro', 'nonexistentword']
+
+
+def build_catalog(count, seed=7):
+    rng = random.Random(seed)
+    with app.app_context():
+        creator = User.query.first()
+        now = datetime.now()
+        batch = []
+        for i in range(count):
+            subject = rng.choice(SUBJECTS)
+            batch.append({
+                'title': f'{rng.choice(ADJECTIVES)} {subject} {rng.choice(FORMATS)} {2020 + i % 7}',
+                'description': ' '.join(rng.choice(FILLER) for _ in range(40)) + f' {subject.lower()}',
+                'location': rng.choice(PLACES),
+                'category': rng.choice(CATEGORIES),
+                'event_date': now + timedelta(days=rng.randint(-300, 300)),
+                'registration_deadline': now + timedelta(days=rng.randint(-300, 290)),
+                'created_by': creator.id,
+                'max_participants': 100,
+                'status': 'upcoming',
+            })
+            if len(batch) == 5000:
+                db.session.execute(db.insert(Event), batch)
+                batch = []
+        if batch:
+            db.session.execute(db.insert(Event), batch)
+        db.session.commit()
+
+
+def time_query(build, runs):
+    timings = []
+    rows = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = len(build().all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        ensure_database_initialized()
+    started = time.perf_counter()
+    build_catalog(args.events)
+    print(f'built {args.events} events in {time.perf_counter() - started:.1f}s')
+
+    with app.app_context():
+        backend = search_backend()
+        print(f'full-text backend: {backend or "none (ILIKE fallback)"}')
+        if backend is None:
+            sys.exit('No full-text index on this database; nothing to compare.')
+
+        def full_text(q, limit=None):
+            query, rank = search_events(Event.query, q)
+            query = query.order_by(rank, Event.event_date)
+            return query.limit(limit) if limit else query
+
+        def ilike(q, limit=None):
+            query = ilike_search_events(Event.query, q).order_by(Event.event_date)
+            return query.limit(limit) if limit else query
+
+        print(f"{'query':<28}{'rows':>14}{'ILIKE ms':>11}{'FTS ms':>9}{'speedup':>9}"
+              f"{'ILIKE top8':>12}{'FTS top8':>10}")
+        for q in QUERIES:
+            ilike_ms, ilike_rows = time_query(lambda: ilike(q), args.runs)
+            fts_ms, fts_rows = time_query(lambda: full_text(q), args.runs)
+            ilike_top_ms, _ = time_query(lambda: ilike(q, 8), args.runs)
+            fts_top_ms, _ = time_query(lambda: full_text(q, 8), args.runs)
+            rows = f'{fts_rows}/{ilike_rows}'
+            print(f'{q:<28}{rows:>14}{ilike_ms:>11.1f}{fts_ms:>9.1f}{ilike_ms / max(fts_ms, 0.001):>8.1f}x'
+                  f'{ilike_top_ms:>12.1f}{fts_top_ms:>10.1f}')
+        print('rows = full-text/ILIKE matches; ILIKE also matches inside words, full-text only word prefixes')
+
+    if _TEMP_DB:
+        os.remove(_TEMP_DB)
+
+
+if __name__ == '__main__':
+    main()
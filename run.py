@@ -1,4 +1,4 @@
-from app import app
+from app import app, ensure_database_initialized
 
 if __name__ == '__main__':
     print("Starting Procur...")
@@ -6,5 +6,7 @@ if __name__ == '__main__':
     print("Procurator @ http://localhost:5001")
     print("Credentials: admin / admin123")
     print("Ctrl + C to kill me ")
+    with app.app_context():
+        ensure_database_initialized()
     
     app.run(debug=True, host='0.0.0.0', port=5001)
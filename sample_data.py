@@ -1,4 +1,5 @@
-from app import app, db, User, Event, EventRegistration, Schedule
+from app import (app, db, User, Event, EventRegistration, Schedule, issue_ticket, recompute_event_counters,
+                 run_migrations)
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 
@@ -6,6 +7,7 @@ def create_sample_data():
     with app.app_context():
 
         db.create_all()
+        run_migrations()
         
         print("Creating sample data...")
         
@@ -250,6 +252,9 @@ def create_sample_data():
         
         for registration in registrations:
             db.session.add(registration)
+            issue_ticket(registration)
+        db.session.commit()
+        recompute_event_counters()
         db.session.commit()
         print(f"Created {len(registrations)} registrations")
         
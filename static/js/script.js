@@ -13,6 +13,7 @@ document.addEventListener("DOMContentLoaded", () => {
 	autoHideAlerts();
 
 	initializeIntersectionObserver();
+	initializeLiveUpdates();
 });
 
 function initializeTooltips() {
@@ -387,6 +388,62 @@ function getNotificationIcon(type) {
 	return icons[type] || "info-circle";
 }
 
+function initializeLiveUpdates() {
+	const streamUrl = document.body.dataset.streamUrl;
+	const liveEvent = document.querySelector("[data-live-event]");
+	if (!streamUrl || !window.EventSource) return;
+	// Only pages that show live data open a stream: each one holds a server thread.
+	if (!document.querySelector("[data-live-user]") && !liveEvent) return;
+
+	const url = new URL(streamUrl, window.location.origin);
+	if (liveEvent) url.searchParams.set("event_id", liveEvent.dataset.liveEvent);
+
+	// EventSource reconnects by itself and resends the last id as Last-Event-ID, but an
+	// error status (a proxy's 503, say) closes it for good: reopen it after a growing delay.
+	let source;
+	let delay = 5000;
+	const connect = () => {
+		source = new EventSource(url);
+		source.addEventListener("open", () => {
+			delay = 5000;
+		});
+		source.addEventListener("error", () => {
+			if (source.readyState !== EventSource.CLOSED) return;
+			setTimeout(connect, delay * (1 + Math.random()));
+			delay = Math.min(delay * 2, 300000);
+		});
+
+		source.addEventListener("notification", (message) => {
+			const data = JSON.parse(message.data);
+			const badge = document.getElementById("navNotificationCount");
+			if (badge) {
+				badge.textContent = (Number.parseInt(badge.textContent, 10) || 0) + 1;
+				badge.classList.remove("hidden");
+			}
+			showNotification(data.title, "info");
+		});
+
+		source.addEventListener("counts", (message) => {
+			const counts = JSON.parse(message.data);
+			const percent = counts.max_participants
+				? Math.round((counts.registration_count / counts.max_participants) * 100)
+				: 0;
+			const values = { ...counts, percent };
+			for (const element of document.querySelectorAll("[data-live]")) {
+				if (element.dataset.live in values) {
+					element.textContent = values[element.dataset.live];
+				}
+			}
+			for (const bar of document.querySelectorAll("[data-live-progress]")) {
+				bar.style.width = `${Math.min(percent, 100)}%`;
+			}
+		});
+	};
+	connect();
+
+	window.addEventListener("beforeunload", () => source.close());
+}
+
 function initializeAnimations() {
 	const animatedElements = document.querySelectorAll(
 		".card, .stats .stat, .feature-card",
@@ -423,47 +480,73 @@ function initializeIntersectionObserver() {
 	});
 }
 
+let quickSearchController;
+
 function performQuickSearch() {
 	const searchInput = document.getElementById("quickSearch");
-	const searchTerm = searchInput.value.toLowerCase().trim();
+	const resultsList = document.getElementById("quickSearchResults");
+	const searchTerm = searchInput.value.trim();
 
 	if (!searchTerm) {
 		showNotification("Please enter a search term", "warning");
 		return;
 	}
 
-	const eventCards = document.querySelectorAll(".event-card");
-	let foundEvents = 0;
+	// Only the latest keystroke's request matters; drop any still in flight.
+	quickSearchController?.abort();
+	quickSearchController = new AbortController();
+
+	const url = `${searchInput.dataset.searchUrl}?q=${encodeURIComponent(searchTerm)}`;
+	fetch(url, { signal: quickSearchController.signal })
+		.then((response) => response.json())
+		.then((data) => {
+			renderQuickSearchResults(resultsList, data.results, searchTerm);
+			updateResultsCount(data.results.length);
+		})
+		.catch((error) => {
+			if (error.name !== "AbortError") {
+				showNotification("Search is unavailable right now", "error");
+			}
+		});
+}
 
-	eventCards.forEach((card, index) => {
-		const title =
-			card.querySelector(".card-title")?.textContent.toLowerCase() || "";
-		const description =
-			card.querySelector("p")?.textContent.toLowerCase() || "";
-		const category =
-			card.querySelector(".badge")?.textContent.toLowerCase() || "";
-		const location = card.textContent.toLowerCase();
+function renderQuickSearchResults(resultsList, results, searchTerm) {
+	if (!resultsList) return;
+	resultsList.innerHTML = "";
 
-		if (
-			title.includes(searchTerm) ||
-			description.includes(searchTerm) ||
-			category.includes(searchTerm) ||
-			location.includes(searchTerm)
-		) {
-			card.parentElement.style.display = "block";
-			card.style.animationDelay = `${index * 0.1}s`;
-			card.classList.add("animate-fade-in");
-			foundEvents++;
-		} else {
-			card.parentElement.style.display = "none";
-		}
+	if (results.length === 0) {
+		const empty = document.createElement("li");
+		empty.className = "disabled";
+		empty.innerHTML = "<span></span>";
+		empty.firstChild.textContent = `No events found for "${searchTerm}"`;
+		resultsList.appendChild(empty);
+	}
+
+	// biome-ignore lint/complexity/noForEach: <explanation>
+	results.forEach((result) => {
+		const item = document.createElement("li");
+		const link = document.createElement("a");
+		link.href = result.url;
+		link.className = "flex justify-between gap-3";
+
+		const title = document.createElement("span");
+		title.className = "font-semibold truncate";
+		title.textContent = result.title;
+
+		const meta = document.createElement("span");
+		meta.className = "text-xs opacity-60 whitespace-nowrap";
+		meta.textContent = `${result.category} · ${new Date(result.event_date).toLocaleDateString()}`;
+
+		link.append(title, meta);
+		item.appendChild(link);
+		resultsList.appendChild(item);
 	});
 
-	updateResultsCount(foundEvents);
+	resultsList.classList.remove("hidden");
+}
 
-	if (foundEvents === 0) {
-		showNotification(`No events found for "${searchTerm}"`, "info");
-	}
+function hideQuickSearchResults() {
+	document.getElementById("quickSearchResults")?.classList.add("hidden");
 }
 
 function updateFilters() {
@@ -533,21 +616,51 @@ function setView(viewType) {
 	}
 }
 
-function loadMoreEvents() {
-	const button = event.target;
-	const originalText = button.innerHTML;
+function loadMoreEvents(clickEvent) {
+	const button = document.getElementById("loadMoreEvents");
+	if (!button) return;
+	clickEvent?.preventDefault();
+	if (button.classList.contains("btn-disabled")) return;
 
+	const originalText = button.innerHTML;
 	button.innerHTML =
 		'<span class="loading loading-spinner loading-sm"></span> Loading...';
-	button.disabled = true;
 	button.classList.add("btn-disabled");
 
-	setTimeout(() => {
-		button.innerHTML = originalText;
-		button.disabled = false;
-		button.classList.remove("btn-disabled");
-		showNotification("More events loaded successfully", "success");
-	}, 2000);
+	const url = new URL(button.href, window.location.origin);
+	url.searchParams.set("format", "json");
+
+	fetch(url)
+		.then((response) => {
+			if (!response.ok) throw new Error(`HTTP ${response.status}`);
+			return response.json();
+		})
+		.then((page) => {
+			document
+				.getElementById("gridViewContainer")
+				?.insertAdjacentHTML("beforeend", page.grid);
+			document
+				.getElementById("listViewContainer")
+				?.insertAdjacentHTML("beforeend", page.list);
+
+			const shown = document.getElementById("shownEventsCount");
+			if (shown) {
+				shown.textContent = Number(shown.textContent) + page.count;
+			}
+
+			if (page.next_url) {
+				button.href = page.next_url;
+				button.innerHTML = originalText;
+				button.classList.remove("btn-disabled");
+			} else {
+				button.remove();
+			}
+		})
+		.catch(() => {
+			button.innerHTML = originalText;
+			button.classList.remove("btn-disabled");
+			showNotification("Could not load more events", "error");
+		});
 }
 
 function showFilterLoading(isLoading) {
@@ -575,11 +688,13 @@ function initializeEnhancedEventsPage() {
 	setView(preferredView);
 
 	const quickSearch = document.getElementById("quickSearch");
-	if (quickSearch) {
-		quickSearch.addEventListener("keypress", (e) => {
-			if (e.key === "Enter") {
-				e.preventDefault();
-				performQuickSearch();
+	if (quickSearch && !quickSearch.dataset.bound) {
+		quickSearch.dataset.bound = "true";
+
+		// Enter submits the form for the full ranked results page.
+		quickSearch.addEventListener("keydown", (e) => {
+			if (e.key === "Escape") {
+				hideQuickSearchResults();
 			}
 		});
 
@@ -587,15 +702,18 @@ function initializeEnhancedEventsPage() {
 		quickSearch.addEventListener("input", function () {
 			clearTimeout(searchTimeout);
 			searchTimeout = setTimeout(() => {
-				if (this.value.length >= 3) {
+				if (this.value.trim().length >= 2) {
 					performQuickSearch();
-				} else if (this.value.length === 0) {
-					// biome-ignore lint/complexity/noForEach: <explanation>
-					document.querySelectorAll(".event-card").forEach((card) => {
-						card.parentElement.style.display = "block";
-					});
+				} else {
+					hideQuickSearchResults();
 				}
-			}, 300);
+			}, 200);
+		});
+
+		document.addEventListener("click", (event) => {
+			if (!quickSearch.form.contains(event.target)) {
+				hideQuickSearchResults();
+			}
 		});
 	}
 
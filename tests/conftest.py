@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration on import, so every test module shares this database.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='procur_test_'), 'app.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ['RATELIMIT_STORAGE_URI'] = 'memory://'
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limits():
+    """Every request comes from one address, so tests would otherwise share (and exhaust) the login limit."""
+    from app import limiter
+    limiter.reset()
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from app import (app, db, Event, EventRegistration, User, Waitlist, ensure_database_initialized,
+                 generate_password_hash)
+
+
+def setup_module():
+    with app.app_context():
+        ensure_database_initialized()
+        for name in ('host', 'ann', 'ben', 'cat', 'dan'):
+            db.session.add(User(username=name, email=f'{name}@example.com', school='S',
+                                role='coordinator' if name == 'host' else 'participant',
+                                password_hash=generate_password_hash(f'{name}-pass')))
+        db.session.commit()
+
+
+def create_event(capacity):
+    with app.app_context():
+        host = User.query.filter_by(username='host').one()
+        event = Event(title='Quiz', description='d', category='academic', location='Hall', max_participants=capacity,
+                      event_date=datetime.now() + timedelta(days=7),
+                      registration_deadline=datetime.now() + timedelta(days=6), created_by=host.id)
+        db.session.add(event)
+        db.session.commit()
+        return event.id
+
+
+def client_for(username):
+    client = app.test_client()
+    assert client.post('/login', data={'username': username, 'password': f'{username}-pass'}).status_code == 302
+    return client
+
+
+def register(username, event_id):
+    return client_for(username).post(f'/event/{event_id}/register')
+
+
+def counters(event_id):
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        return event.registration_count, event.confirmed_count, event.waitlist_count
+
+
+def state(event_id):
+    """Each user's registration status (or 'waitlisted') for the event."""
+    with app.app_context():
+        rows = {user: status for user, status in db.session.query(User.username, EventRegistration.status).join(
+            EventRegistration, EventRegistration.user_id == User.id).filter(EventRegistration.event_id == event_id)}
+        rows.update((user, 'waitlisted') for (user,) in db.session.query(User.username).join(
+            Waitlist, Waitlist.user_id == User.id).filter(Waitlist.event_id == event_id))
+        return rows
+
+
+def test_registration_over_capacity_goes_to_the_waitlist():
+    event_id = create_event(capacity=2)
+    for username in ('ann', 'ben', 'cat'):
+        assert register(username, event_id).status_code == 302
+    assert state(event_id) == {'ann': 'confirmed', 'ben': 'confirmed', 'cat': 'waitlisted'}
+    assert counters(event_id) == (2, 2, 1)
+
+
+def test_cancelling_promotes_the_waitlist_and_keeps_counters_right():
+    event_id = create_event(capacity=1)
+    for username in ('ann', 'ben', 'cat'):
+        register(username, event_id)
+    assert counters(event_id) == (1, 1, 2)
+
+    assert client_for('ann').post(f'/event/{event_id}/cancel').status_code == 302
+    assert state(event_id) == {'ann': 'cancelled', 'ben': 'confirmed', 'cat': 'waitlisted'}
+    assert counters(event_id) == (1, 1, 1)
+
+    client_for('cat').post(f'/event/{event_id}/cancel')
+    assert state(event_id) == {'ann': 'cancelled', 'ben': 'confirmed'}
+    assert counters(event_id) == (1, 1, 0)
+
+
+def test_duplicate_registration_is_rejected():
+    event_id = create_event(capacity=5)
+    client = client_for('dan')
+    client.post(f'/event/{event_id}/register')
+    client.get('/dashboard')  # consume the "registered" flash
+    assert client.post(f'/event/{event_id}/register').status_code == 302
+    with client.session_transaction() as session:
+        assert ('info', 'You are already registered for this event') in session['_flashes']
+    assert state(event_id) == {'dan': 'confirmed'}
+    assert counters(event_id) == (1, 1, 0)
@@ -0,0 +1,84 @@
+import sqlite3
+
+from sqlalchemy import event as sa_event
+
+from app import app, db, User, ensure_database_initialized, generate_password_hash, load_user, user_cache
+
+
+def setup_module():
+    with app.app_context():
+        ensure_database_initialized()
+        db.session.add(User(username='boss', email='boss@example.com', school='S', role='admin',
+                            password_hash=generate_password_hash('boss-pass')))
+        db.session.commit()
+
+
+def change_outside_the_cache(**values):
+    """Update the user as another worker would: straight in the database, bumping the version."""
+    assignments = ', '.join(f'{column} = :{column}' for column in values)
+    with app.app_context(), sqlite3.connect(db.engine.url.database) as connection:
+        connection.execute(f"UPDATE user SET {assignments}, version = version + 1 WHERE username = 'boss'", values)
+
+
+def expire_cached_users():
+    """What happens in every worker at the latest USER_CACHE_TTL seconds after the change."""
+    user_cache.invalidate()
+
+
+def login():
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'boss', 'password': 'boss-pass'})
+    assert response.status_code == 302
+    assert client.get('/admin').status_code == 200  # the user is now in this process's cache
+    return client
+
+
+def session_user_id(client):
+    with client.session_transaction() as session:
+        return session['_user_id']
+
+
+def test_cache_hit_issues_no_queries():
+    client = login()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.test_request_context():
+        sa_event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            user = load_user(session_user_id(client))
+            assert user.username == 'boss' and user.role == 'admin'
+        finally:
+            sa_event.remove(db.engine, 'before_cursor_execute', record)
+    assert statements == []
+
+
+def test_demotion_in_another_process_applies_once_the_cache_expires():
+    client = login()
+    change_outside_the_cache(role='participant')
+    assert client.get('/admin').status_code == 200  # still within USER_CACHE_TTL
+    expire_cached_users()
+    response = client.get('/admin')
+    assert response.status_code in (302, 403)
+    assert '/admin' not in response.headers.get('Location', '')
+    change_outside_the_cache(role='admin')
+
+
+def test_version_bump_logs_out_existing_sessions():
+    client = login()
+    change_outside_the_cache(role='admin')
+    expire_cached_users()
+    response = client.get('/dashboard')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+
+def test_legacy_session_without_version_is_accepted_and_stamped():
+    client = login()
+    uid = session_user_id(client).partition(':')[0]
+    with client.session_transaction() as session:
+        session['_user_id'] = uid
+    assert client.get('/dashboard').status_code == 200
+    assert session_user_id(client).startswith(f'{uid}:')